@@ -1,9 +1,44 @@
+import hashlib
+import os
+
 import pandas as pd
 
 import repsys.dtypes as dtypes
 from repsys.dataset import Dataset
 
 
+# bump the version whenever the preparation of the cached data changes
+CACHE_VERSION = 2
+
+
+def read_csv_cached(csv_path, prepare=None, **kwargs):
+    # the parsed data are cached in the binary pickle format next to the CSV file, the cache
+    # is refreshed whenever the CSV file is modified or the data are read in a different way
+    key = repr((CACHE_VERSION, sorted(kwargs.items()), prepare.__qualname__ if prepare else None))
+    digest = hashlib.md5(key.encode()).hexdigest()[:8]
+    cache_path = f"{os.path.splitext(csv_path)[0]}.{digest}.pkl"
+    if os.path.isfile(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(csv_path):
+        return pd.read_pickle(cache_path)
+
+    df = pd.read_csv(csv_path, **kwargs)
+    if prepare is not None:
+        df = prepare(df)
+
+    # the cache is written under a temporary name first, so an interrupted
+    # or a concurrent run never leaves a partially written file behind
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    df.to_pickle(tmp_path)
+    os.replace(tmp_path, cache_path)
+    return df
+
+
+def add_year_col(df):
+    # extract the year as a series (not a frame) and convert it right away,
+    # movies without the year are kept missing by the nullable integer type
+    df["year"] = df["title"].str.extract(r"\((\d{4})\)", expand=False).astype("Int64")
+    return df
+
+
 class MovieLens(Dataset):
     def name(self):
         return "ml20m"
@@ -13,7 +48,7 @@ class MovieLens(Dataset):
             "movieId": dtypes.ItemID(),
             "title": dtypes.Title(),
             "genres": dtypes.Tag(sep="|"),
-            "year": dtypes.Number(data_type=int),
+            "year": dtypes.Number(data_type=int, empty_value=None),
         }
 
     def interaction_cols(self):
@@ -24,12 +59,10 @@ class MovieLens(Dataset):
         }
 
     def load_items(self):
-        df = pd.read_csv("./ml-20m/movies.csv")
-        df["year"] = df["title"].str.extract(r"\((\d+)\)")
-        return df
+        return read_csv_cached("./ml-20m/movies.csv", prepare=add_year_col)
 
     def load_interactions(self):
-        df = pd.read_csv("./ml-20m/ratings.csv")
+        df = read_csv_cached("./ml-20m/ratings.csv")
         df = df[df["rating"] > 3.5]
         df["rating"] = 1
         return df
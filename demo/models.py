@@ -1,11 +1,10 @@
 import os
 from abc import ABC
 
+import numba
 import numpy as np
-import scipy.sparse as sp
 from scipy.sparse import csr_matrix
-from sklearn.neighbors import NearestNeighbors
-from sklearn.preprocessing import MinMaxScaler
+from sklearn.preprocessing import MinMaxScaler, normalize
 from sklearn.utils.extmath import randomized_svd
 
 from repsys import Model
@@ -13,6 +12,20 @@ from repsys.helpers import set_seed
 from repsys.ui import Select, Number
 
 
+@numba.njit(parallel=True, cache=True)
+def aggregate_neighbors(n_indices, n_weights, indptr, indices, data, item_mask, X_predict):
+    # accumulate the weighted CSR rows of the neighbors directly into the dense
+    # predictions, users are processed in parallel and the items filtered out
+    # by the mask are skipped
+    for u in numba.prange(n_indices.shape[0]):
+        for j in range(n_indices.shape[1]):
+            row = n_indices[u, j]
+            weight = n_weights[u, j]
+            for p in range(indptr[row], indptr[row + 1]):
+                if item_mask[indices[p]]:
+                    X_predict[u, indices[p]] += weight * data[p]
+
+
 class BaseModel(Model, ABC):
     def _checkpoint_path(self):
         return os.path.join("./checkpoints", f"{self.name()}.npy")
@@ -22,18 +35,24 @@ class BaseModel(Model, ABC):
         if not os.path.exists(dir_path):
             os.makedirs(dir_path, exist_ok=True)
 
-    def _mask_items(self, X_predict, item_indices):
-        mask = np.ones(self.dataset.items.shape[0], dtype=bool)
-        mask[item_indices] = 0
-        X_predict[:, mask] = 0
+    def _erase_history(self, X_predict, X):
+        # zero the already interacted items using the CSR structure directly
+        rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+        X_predict[rows, X.indices] = 0
 
-    def _filter_items(self, X_predict, col, value):
-        indices = self.dataset.filter_items_by_tags(col, [value])
-        self._mask_items(X_predict, indices)
+    def _items_mask(self, **kwargs):
+        # boolean mask of the items passing the filters, None if there is no filter
+        if kwargs.get("genre"):
+            mask = np.zeros(self.dataset.items.shape[0], dtype=bool)
+            mask[self.dataset.filter_items_by_tags("genres", [kwargs.get("genre")])] = True
+            return mask
+
+        return None
 
     def _apply_filters(self, X_predict, **kwargs):
-        if kwargs.get("genre"):
-            self._filter_items(X_predict, "genres", kwargs.get("genre"))
+        mask = self._items_mask(**kwargs)
+        if mask is not None:
+            X_predict[:, ~mask] = 0
 
     def web_params(self):
         return {
@@ -42,41 +61,74 @@ class BaseModel(Model, ABC):
 
 
 class KNN(BaseModel):
-    def __init__(self, n: int = 50):
-        self.model = NearestNeighbors(algorithm="brute", n_neighbors=n, metric="cosine")
+    def __init__(self, n: int = 50, batch_size: int = 256):
+        self.n_neighbors = n
+        self.batch_size = batch_size
+        self.X_train_T = None
+        self.train_indptr = None
+        self.train_indices = None
+        self.train_data = None
 
     def name(self):
         return "knn"
 
     def fit(self, training=False):
-        X = self.dataset.get_train_data()
-        self.model.fit(X)
+        # scores do not need the double precision, float32 halves
+        # the memory traffic of the search and the aggregation
+        X_train = self.dataset.get_train_data().astype(np.float32, copy=False)
+
+        # the L2-normalized training users are kept transposed, so the cosine
+        # similarities of a batch of users are computed by a single product
+        self.X_train_T = normalize(X_train).T.tocsr()
+
+        # sparse matrices can not be passed to the Numba kernel,
+        # so the CSR arrays are unpacked only once here
+        self.train_indptr = X_train.indptr
+        self.train_indices = X_train.indices
+        self.train_data = X_train.data
 
     def predict(self, X, **kwargs):
         if X.count_nonzero() == 0:
             return np.random.uniform(size=X.shape)
 
-        if kwargs.get("neighbors"):
-            n_distances, n_indices = self.model.kneighbors(X, n_neighbors=kwargs.get("neighbors"))
-        else:
-            n_distances, n_indices = self.model.kneighbors(X)
-
-        n_distances = 1 - n_distances
-
-        sums = n_distances.sum(axis=1)
-        n_distances = n_distances / sums[:, np.newaxis]
-
-        def f(dist, idx):
-            A = self.dataset.get_train_data()[idx]
-            D = sp.diags(dist)
-            return D.dot(A).sum(axis=0)
-
-        vf = np.vectorize(f, signature="(n),(n)->(m)")
-        X_predict = vf(n_distances, n_indices)
-
-        X_predict[X.nonzero()] = 0
-
-        self._apply_filters(X_predict, **kwargs)
+        X_norm = normalize(X.astype(np.float32, copy=False))
+
+        n_items, n_train = self.X_train_T.shape
+        n_neighbors = min(kwargs.get("neighbors") or self.n_neighbors, n_train)
+        X_predict = np.zeros((X.shape[0], n_items), dtype=np.float32)
+
+        # the filtered out items are skipped already during the aggregation
+        item_mask = self._items_mask(**kwargs)
+        if item_mask is None:
+            item_mask = np.ones(n_items, dtype=bool)
+
+        # search the neighbors and aggregate their interactions batch by batch,
+        # the similarities are computed in cache-sized blocks and the neighbors
+        # of a batch are consumed while they are still hot
+        for i in range(0, X_norm.shape[0], self.batch_size):
+            sim = X_norm[i : i + self.batch_size].dot(self.X_train_T).toarray()
+            # the order of the neighbors does not matter for the weighted sum,
+            # so partitioning the similarities is enough instead of sorting them
+            n_indices = np.argpartition(-sim, n_neighbors - 1, axis=1)[:, :n_neighbors]
+            n_weights = np.take_along_axis(sim, n_indices, axis=1)
+
+            # normalize the similarities per user, users without
+            # any similar neighbor get no weights at all
+            sums = n_weights.sum(axis=1)[:, np.newaxis]
+            n_weights = np.divide(n_weights, sums, out=np.zeros_like(n_weights), where=sums > 0)
+
+            # the prediction is a weighted sum of the neighbors interactions
+            aggregate_neighbors(
+                n_indices,
+                n_weights,
+                self.train_indptr,
+                self.train_indices,
+                self.train_data,
+                item_mask,
+                X_predict[i : i + self.batch_size],
+            )
+
+        self._erase_history(X_predict, X)
 
         return X_predict
 
@@ -87,6 +139,8 @@ class KNN(BaseModel):
 
 
 class TopPopular(BaseModel):
+    batchable = True
+
     def __init__(self):
         self.item_ratings = None
         self.scaler = MinMaxScaler()
@@ -104,7 +158,7 @@ class TopPopular(BaseModel):
 
     def predict(self, X: csr_matrix, **kwargs):
         X_predict = np.ones(X.shape)
-        X_predict[X.nonzero()] = 0
+        self._erase_history(X_predict, X)
 
         X_predict = X_predict * self.item_ratings
 
@@ -122,7 +176,7 @@ class Rand(BaseModel):
 
     def predict(self, X: csr_matrix, **kwargs):
         X_predict = np.ones(X.shape)
-        X_predict[X.nonzero()] = 0
+        self._erase_history(X_predict, X)
 
         set_seed(self.config.seed)
         item_ratings = np.random.uniform(size=X.shape)
@@ -134,6 +188,8 @@ class Rand(BaseModel):
 
 
 class PureSVD(BaseModel):
+    batchable = True
+
     def __init__(self, n_factors: int = 50):
         self.n_factors = n_factors
         self.sim = None
@@ -151,12 +207,13 @@ class PureSVD(BaseModel):
     def fit(self, training=False):
         X = self.dataset.get_train_data()
 
-        U, sigma, VT = randomized_svd(X, self.n_factors, random_state=self.config.seed)
+        U, sigma, VT = randomized_svd(X, self.n_factors, n_iter=4, random_state=self.config.seed)
+        VT = VT.astype(np.float32)
         self.sim = VT.T.dot(VT)
 
     def predict(self, X: csr_matrix, **kwargs):
         X_predict = X.dot(self.sim)
-        X_predict[X.nonzero()] = 0
+        self._erase_history(X_predict, X)
 
         self._apply_filters(X_predict, **kwargs)
 
@@ -164,6 +221,8 @@ class PureSVD(BaseModel):
 
 
 class EASE(BaseModel):
+    batchable = True
+
     def __init__(self, lmb: int = 100):
         self.sim = None
         self.lmb = lmb
@@ -194,7 +253,7 @@ class EASE(BaseModel):
 
     def predict(self, X: csr_matrix, **kwargs):
         X_predict = X.dot(self.sim)
-        X_predict[X.nonzero()] = 0
+        self._erase_history(X_predict, X)
 
         self._apply_filters(X_predict, **kwargs)
 
@@ -1,5 +1,7 @@
 import { createApi, fetchBaseQuery } from '@reduxjs/toolkit/query/react';
 
+import { columnsToRecords } from './utils';
+
 export const repsysApi = createApi({
   reducerPath: 'repsysApi',
   baseQuery: fetchBaseQuery({ baseUrl: '/api/' }),
@@ -81,9 +83,12 @@ export const repsysApi = createApi({
     }),
     getUserEmbeddings: builder.query({
       query: (split = 'train') => `/users/embeddings?split=${split}`,
+      // embeddings are sent by columns to keep the response small
+      transformResponse: columnsToRecords,
     }),
     getItemEmbeddings: builder.query({
       query: (split = 'train') => `/items/embeddings?split=${split}`,
+      transformResponse: columnsToRecords,
     }),
     getDefaultConfig: builder.query({
       query: () => '/web/config',
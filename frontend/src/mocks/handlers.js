@@ -12,6 +12,7 @@ import {
   trainUsersEmbeddings,
 } from './data/users';
 import defaultConfig from './data/config';
+import { recordsToColumns } from '../utils';
 
 function shuffle(a) {
   const b = a.slice();
@@ -47,7 +48,7 @@ export const handlers = [
     const split = req.url.searchParams.get('split');
     if (!split) return res(ctx.status(400));
     const data = split === 'validation' ? vadUsersEmbeddings : trainUsersEmbeddings;
-    return res(ctx.delay(1500), ctx.json(data));
+    return res(ctx.delay(1500), ctx.json(recordsToColumns(data)));
   }),
   rest.post('/api/users/search', (req, res, ctx) => {
     const { split } = req.body;
@@ -111,6 +112,6 @@ export const handlers = [
   rest.get('/api/items/embeddings', (req, res, ctx) => {
     const split = req.url.searchParams.get('split');
     if (!split) return res(ctx.status(400));
-    return res(ctx.delay(500), ctx.json(itemsEmbeddings));
+    return res(ctx.delay(500), ctx.json(recordsToColumns(itemsEmbeddings)));
   }),
 ];
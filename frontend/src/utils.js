@@ -45,4 +45,33 @@ function generateUID() {
   return firstPart + secondPart;
 }
 
-export { sleep, capitalize, mergeDeep, sliceIdentifier, generateUID };
+function columnsToRecords(columns) {
+  const keys = Object.keys(columns);
+  if (!keys.length) return [];
+  return columns[keys[0]].map((_, index) =>
+    keys.reduce((acc, key) => {
+      acc[key] = columns[key][index];
+      return acc;
+    }, {})
+  );
+}
+
+function recordsToColumns(records) {
+  return records.reduce((acc, record) => {
+    Object.keys(record).forEach((key) => {
+      if (!acc[key]) acc[key] = [];
+      acc[key].push(record[key]);
+    });
+    return acc;
+  }, {});
+}
+
+export {
+  sleep,
+  capitalize,
+  mergeDeep,
+  sliceIdentifier,
+  generateUID,
+  columnsToRecords,
+  recordsToColumns,
+};
@@ -1,6 +1,4 @@
-from repsys.dataset import Dataset
-from repsys.evaluators import ModelEvaluator, DatasetEvaluator
-from repsys.model import Model
+import importlib
 
 __all__ = [
     "Model",
@@ -8,3 +6,23 @@ __all__ = [
     "ModelEvaluator",
     "DatasetEvaluator",
 ]
+
+# the public classes are imported lazily (PEP 562), so importing the package
+# (e.g. by the command-line utility) does not load pandas, scikit-learn or umap
+_modules = {
+    "Model": "repsys.model",
+    "Dataset": "repsys.dataset",
+    "ModelEvaluator": "repsys.evaluators",
+    "DatasetEvaluator": "repsys.evaluators",
+}
+
+
+def __getattr__(name):
+    if name in _modules:
+        return getattr(importlib.import_module(_modules[name]), name)
+
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_modules))
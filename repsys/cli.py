@@ -1,22 +1,19 @@
 import logging
-from typing import Dict
+from typing import Dict, TYPE_CHECKING
 
 import click
 import coloredlogs
 from click import Context
 
 from repsys.config import read_config
-from repsys.core import (
-    train_models,
-    evaluate_dataset,
-    start_server,
-    split_dataset,
-    evaluate_models,
-)
-from repsys.dataset import Dataset
 from repsys.helpers import *
 from repsys.loaders import load_packages
-from repsys.model import Model
+
+# the heavy modules (pandas, scikit-learn, umap, sanic) are imported
+# inside the commands, so the startup of the utility stays fast
+if TYPE_CHECKING:
+    from repsys.dataset import Dataset
+    from repsys.model import Model
 
 logger = logging.getLogger(__name__)
 
@@ -34,10 +31,14 @@ def config_callback(ctx, param, value):
 
 
 def models_callback(ctx, param, value):
+    from repsys.model import Model
+
     return load_packages(value, Model)
 
 
 def dataset_callback(ctx, param, value):
+    from repsys.dataset import Dataset
+
     instances = load_packages(value, Dataset)
     default_name = list(instances.keys())[0]
     if len(instances) > 1:
@@ -111,8 +112,10 @@ def repsys_group(ctx, debug, config):
 @models_pkg_option
 @dataset_pkg_option
 @click.pass_context
-def server_start_cmd(ctx: Context, models: Dict[str, Model], dataset: Dataset):
+def server_start_cmd(ctx: Context, models: Dict[str, "Model"], dataset: "Dataset"):
     """Start web application server."""
+    from repsys.core import start_server
+
     start_server(ctx.obj["CONFIG"], models, dataset)
 
 
@@ -148,12 +151,14 @@ repsys_group.add_command(models_group)
 @click.option("-m", "--model-name", help="Model to evaluate.")
 def models_eval_cmd(
     ctx: Context,
-    models: Dict[str, Model],
-    dataset: Dataset,
+    models: Dict[str, "Model"],
+    dataset: "Dataset",
     split: str,
     model_name: str,
 ):
     """Evaluate models using validation/test split."""
+    from repsys.core import evaluate_models
+
     evaluate_models(ctx.obj["CONFIG"], models, dataset, split, model_name)
 
 
@@ -162,8 +167,10 @@ def models_eval_cmd(
 @models_pkg_option
 @click.pass_context
 @click.option("-m", "--model-name", help="Model to train.")
-def models_train_cmd(ctx: Context, models: Dict[str, Model], dataset: Dataset, model_name: str):
+def models_train_cmd(ctx: Context, models: Dict[str, "Model"], dataset: "Dataset", model_name: str):
     """Train models using train split."""
+    from repsys.core import train_models
+
     train_models(ctx.obj["CONFIG"], models, dataset, model_name)
 
 
@@ -171,8 +178,10 @@ def models_train_cmd(ctx: Context, models: Dict[str, Model], dataset: Dataset, m
 @dataset_group.command(name="split")
 @dataset_pkg_option
 @click.pass_context
-def dataset_split_cmd(ctx: Context, dataset: Dataset):
+def dataset_split_cmd(ctx: Context, dataset: "Dataset"):
     """Create train/validation/test split."""
+    from repsys.core import split_dataset
+
     split_dataset(ctx.obj["CONFIG"], dataset)
 
 
@@ -188,10 +197,12 @@ def dataset_split_cmd(ctx: Context, dataset: Dataset):
 @click.option("-m", "--model-name", help="Embeddings model.")
 def dataset_eval_cmd(
     ctx: Context,
-    dataset: Dataset,
-    models: Dict[str, Model],
+    dataset: "Dataset",
+    models: Dict[str, "Model"],
     method: str,
     model_name: str,
 ):
     """Compute dataset embeddings."""
+    from repsys.core import evaluate_dataset
+
     evaluate_dataset(ctx.obj["CONFIG"], models, dataset, method, model_name)
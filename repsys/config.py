@@ -1,74 +1,88 @@
 import configparser
 import os
-from typing import List
+from dataclasses import dataclass
+from typing import Dict, List
 
 import repsys.constants as const
 from repsys.errors import InvalidConfigError
 
 
-class DatasetConfig:
-    def __init__(
-        self,
-        test_holdout_prop: float,
-        train_split_prop: float,
-        min_user_interacts: int,
-        min_item_interacts: int,
-    ):
-        self.test_holdout_prop = test_holdout_prop
-        self.train_split_prop = train_split_prop
-        self.min_user_interacts = min_user_interacts
-        self.min_item_interacts = min_item_interacts
-
-
-class EvaluationConfig:
-    def __init__(
-        self,
-        precision_recall_k: List[int],
-        ndcg_k: List[int],
-        coverage_k: List[int],
-        diversity_k: List[int],
-        novelty_k: List[int],
-        percentage_lt_k: List[int],
-        coverage_lt_k: List[int],
-    ):
-        self.precision_recall_k = precision_recall_k
-        self.ndcg_k = ndcg_k
-        self.coverage_k = coverage_k
-        self.diversity_k = diversity_k
-        self.novelty_k = novelty_k
-        self.percentage_lt_k = percentage_lt_k
-        self.coverage_lt_k = coverage_lt_k
-
-
-class VisualizationConfig:
-    def __init__(
-        self, embed_method: str, pymde_neighbors: int, umap_neighbors: int, umap_min_dist: float, tsne_perplexity: int
-    ):
-        self.embed_method = embed_method
-        self.pymde_neighbors = pymde_neighbors
-        self.umap_neighbors = umap_neighbors
-        self.umap_min_dist = umap_min_dist
-        self.tsne_perplexity = tsne_perplexity
-
-
-class Config:
-    def __init__(
-        self,
-        checkpoints_dir: str,
-        seed: int,
-        debug: bool,
-        server_port: int,
-        dataset_config: DatasetConfig,
-        eval_config: EvaluationConfig,
-        visual_config: VisualizationConfig,
-    ):
-        self.dataset = dataset_config
-        self.eval = eval_config
-        self.checkpoints_dir = checkpoints_dir
-        self.debug = debug
-        self.seed = seed
-        self.server_port = server_port
-        self.visual = visual_config
+class FrozenConfig:
+    # frozen dataclasses with slots can not be restored by the default
+    # pickle/copy protocol, so the state is set through the object directly
+    __slots__ = ()
+
+    def __getstate__(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            object.__setattr__(self, name, value)
+
+
+@dataclass(frozen=True)
+class DatasetConfig(FrozenConfig):
+    __slots__ = ("test_holdout_prop", "train_split_prop", "min_user_interacts", "min_item_interacts")
+
+    test_holdout_prop: float
+    train_split_prop: float
+    min_user_interacts: int
+    min_item_interacts: int
+
+    def __post_init__(self):
+        validate_dataset_config(self)
+
+
+@dataclass(frozen=True)
+class EvaluationConfig(FrozenConfig):
+    __slots__ = (
+        "precision_recall_k",
+        "ndcg_k",
+        "coverage_k",
+        "diversity_k",
+        "novelty_k",
+        "percentage_lt_k",
+        "coverage_lt_k",
+    )
+
+    precision_recall_k: List[int]
+    ndcg_k: List[int]
+    coverage_k: List[int]
+    diversity_k: List[int]
+    novelty_k: List[int]
+    percentage_lt_k: List[int]
+    coverage_lt_k: List[int]
+
+
+@dataclass(frozen=True)
+class VisualizationConfig(FrozenConfig):
+    __slots__ = ("embed_method", "pymde_neighbors", "umap_neighbors", "umap_min_dist", "tsne_perplexity")
+
+    embed_method: str
+    pymde_neighbors: int
+    umap_neighbors: int
+    umap_min_dist: float
+    tsne_perplexity: int
+
+    def __post_init__(self):
+        validate_visual_config(self)
+
+
+@dataclass(frozen=True)
+class Config(FrozenConfig):
+    __slots__ = ("checkpoints_dir", "seed", "debug", "server_port", "server_workers", "dataset", "eval", "visual")
+
+    checkpoints_dir: str
+    seed: int
+    debug: bool
+    server_port: int
+    server_workers: int
+    dataset: DatasetConfig
+    eval: EvaluationConfig
+    visual: VisualizationConfig
+
+    def __post_init__(self):
+        validate_server_config(self)
 
 
 def validate_dataset_config(config: DatasetConfig):
@@ -85,6 +99,11 @@ def validate_dataset_config(config: DatasetConfig):
         raise InvalidConfigError("Minimum item interactions can be negative")
 
 
+def validate_server_config(config: Config):
+    if config.server_workers < 1:
+        raise InvalidConfigError("The server must run at least one worker")
+
+
 def validate_visual_config(config: VisualizationConfig):
     if config.embed_method not in ["umap", "pymde", "tsne", "custom"]:
         raise InvalidConfigError("Invalid embedding method (none of: umap, pymde, tsne or custom)")
@@ -96,6 +115,21 @@ def parse_list(arg: str, sep: str = ","):
     return arg
 
 
+def parse_bool(arg: str, key: str):
+    if isinstance(arg, str):
+        value = configparser.ConfigParser.BOOLEAN_STATES.get(arg.strip().lower())
+        if value is None:
+            raise InvalidConfigError(f"Value '{arg}' of '{key}' is not a boolean")
+        return value
+    return arg
+
+
+def read_section(config: configparser.ConfigParser, section: str) -> Dict[str, str]:
+    # read all options of the section at once, the defaults
+    # are then applied by plain lookups into the dictionary
+    return dict(config[section]) if config.has_section(section) else {}
+
+
 def read_config(config_path: str = None):
     config = configparser.ConfigParser()
 
@@ -103,46 +137,43 @@ def read_config(config_path: str = None):
         with open(config_path, "r") as f:
             config.read_file(f)
 
+    general = read_section(config, "general")
+    server = read_section(config, "server")
+    dataset = read_section(config, "dataset")
+    evaluation = read_section(config, "evaluation")
+    visualization = read_section(config, "visualization")
+
     dataset_config = DatasetConfig(
-        config.getfloat("dataset", "test_holdout_prop", fallback=const.DEFAULT_TEST_HOLDOUT_PROP),
-        config.getfloat("dataset", "train_split_prop", fallback=const.DEFAULT_TRAIN_SPLIT_PROP),
-        config.getint("dataset", "min_user_interacts", fallback=const.DEFAULT_MIN_USER_INTERACTS),
-        config.getint("dataset", "min_item_interacts", fallback=const.DEFAULT_MIN_ITEM_INTERACTS),
+        float(dataset.get("test_holdout_prop", const.DEFAULT_TEST_HOLDOUT_PROP)),
+        float(dataset.get("train_split_prop", const.DEFAULT_TRAIN_SPLIT_PROP)),
+        int(dataset.get("min_user_interacts", const.DEFAULT_MIN_USER_INTERACTS)),
+        int(dataset.get("min_item_interacts", const.DEFAULT_MIN_ITEM_INTERACTS)),
     )
 
-    validate_dataset_config(dataset_config)
-
     evaluator_config = EvaluationConfig(
-        parse_list(
-            config.get(
-                "evaluation",
-                "precision_recall_k",
-                fallback=const.DEFAULT_PRECISION_RECALL_K,
-            )
-        ),
-        parse_list(config.get("evaluation", "ndcg_k", fallback=const.DEFAULT_NDCG_K)),
-        parse_list(config.get("evaluation", "coverage_k", fallback=const.DEFAULT_COVERAGE_K)),
-        parse_list(config.get("evaluation", "diversity_k", fallback=const.DEFAULT_DIVERSITY_K)),
-        parse_list(config.get("evaluation", "novelty_k", fallback=const.DEFAULT_NOVELTY_K)),
-        parse_list(config.get("evaluation", "percentage_lt_k", fallback=const.DEFAULT_PERCENTAGE_LT_K)),
-        parse_list(config.get("evaluation", "coverage_lt_k", fallback=const.DEFAULT_COVERAGE_LT_K)),
+        parse_list(evaluation.get("precision_recall_k", const.DEFAULT_PRECISION_RECALL_K)),
+        parse_list(evaluation.get("ndcg_k", const.DEFAULT_NDCG_K)),
+        parse_list(evaluation.get("coverage_k", const.DEFAULT_COVERAGE_K)),
+        parse_list(evaluation.get("diversity_k", const.DEFAULT_DIVERSITY_K)),
+        parse_list(evaluation.get("novelty_k", const.DEFAULT_NOVELTY_K)),
+        parse_list(evaluation.get("percentage_lt_k", const.DEFAULT_PERCENTAGE_LT_K)),
+        parse_list(evaluation.get("coverage_lt_k", const.DEFAULT_COVERAGE_LT_K)),
     )
 
     visual_config = VisualizationConfig(
-        config.get("visualization", "embed_method", fallback=const.DEFAULT_EMBED_METHOD),
-        config.getint("visualization", "pymde_neighbors", fallback=const.DEFAULT_PYMDE_NEIGHBORS),
-        config.getint("visualization", "umap_neighbors", fallback=const.DEFAULT_UMAP_NEIGHBORS),
-        config.getfloat("visualization", "umap_min_dist", fallback=const.DEFAULT_UMAP_MIN_DIST),
-        config.getint("visualization", "tsne_perplexity", fallback=const.DEFAULT_TSNE_PERPLEXITY),
+        visualization.get("embed_method", const.DEFAULT_EMBED_METHOD),
+        int(visualization.get("pymde_neighbors", const.DEFAULT_PYMDE_NEIGHBORS)),
+        int(visualization.get("umap_neighbors", const.DEFAULT_UMAP_NEIGHBORS)),
+        float(visualization.get("umap_min_dist", const.DEFAULT_UMAP_MIN_DIST)),
+        int(visualization.get("tsne_perplexity", const.DEFAULT_TSNE_PERPLEXITY)),
     )
 
-    validate_visual_config(visual_config)
-
     return Config(
-        config.get("general", "checkpoints_dir", fallback=const.DEFAULT_CHECKPOINTS_DIR),
-        config.getint("general", "seed", fallback=const.DEFAULT_SEED),
-        config.getboolean("general", "debug", fallback=False),
-        config.get("server", "port", fallback=const.DEFAULT_SERVER_PORT),
+        general.get("checkpoints_dir", const.DEFAULT_CHECKPOINTS_DIR),
+        int(general.get("seed", const.DEFAULT_SEED)),
+        parse_bool(general.get("debug", False), "debug"),
+        int(server.get("port", const.DEFAULT_SERVER_PORT)),
+        int(server.get("workers", const.DEFAULT_SERVER_WORKERS)),
         dataset_config,
         evaluator_config,
         visual_config,
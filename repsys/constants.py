@@ -2,8 +2,12 @@ CURRENT_VERSION = "0.3.6"
 
 DEFAULT_CHECKPOINTS_DIR = ".repsys_checkpoints"
 DEFAULT_SERVER_PORT = 3001
+DEFAULT_SERVER_WORKERS = 1
 DEFAULT_SEED = 1234
 
+PREDICT_BATCH_WINDOW = 0.005
+PREDICT_BATCH_SIZE = 64
+
 DEFAULT_TEST_HOLDOUT_PROP = 0.2
 DEFAULT_TRAIN_SPLIT_PROP = 0.85
 DEFAULT_MIN_USER_INTERACTS = 5
@@ -1,8 +1,8 @@
 import logging
 import os
 import typing
-import math
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Tuple, List, Optional, Any
 
 import numpy as np
@@ -10,7 +10,7 @@ import pandas as pd
 from bidict import frozenbidict
 from numpy import ndarray
 from pandas import DataFrame, Series, Index
-from scipy.sparse import csr_matrix
+from scipy.sparse import csr_matrix, save_npz, load_npz
 from sklearn.feature_extraction.text import TfidfTransformer
 
 import repsys.dtypes as dtypes
@@ -19,7 +19,6 @@ from repsys.helpers import (
     tmp_dir_path,
     unzip_dir,
     zip_dir,
-    set_seed,
     tmpdir_provider,
     find_checkpoints,
     current_ts,
@@ -44,43 +43,91 @@ class Split:
         self.holdout_matrix = holdout_matrix
         self.user_index = user_index
 
+        # the holdout statistics depend only on the split, so they are shared by all the evaluated models
+        self.holdout_nonzero: Optional[ndarray] = None
+        self.holdout_idcg: Dict[int, ndarray] = {}
+
         if holdout_matrix is None:
             self.complete_matrix = train_matrix
         else:
             self.complete_matrix = train_matrix + holdout_matrix
+            self.holdout_nonzero = np.diff((holdout_matrix > 0).indptr)
+
+
+def factorize_ids(values: Series) -> Tuple[ndarray, ndarray]:
+    # only the unique values are converted to string ids, the integer codes
+    # are renumbered to follow the order of the string ids
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    ids, inverse = np.unique(uniques.astype(str), return_inverse=True)
+    return inverse[codes], ids
+
+
+def codes_lookup(codes: ndarray, n_codes: int) -> ndarray:
+    # a dense table translating the codes to their positions in the index
+    lookup = np.full(n_codes, -1, dtype=np.int64)
+    lookup[codes] = np.arange(codes.shape[0])
+    return lookup
 
 
-def reindex_data(df: DataFrame, user_index: frozenbidict, item_index: frozenbidict) -> None:
-    df["user"] = df["user"].apply(lambda x: user_index[x])
-    df["item"] = df["item"].apply(lambda x: item_index[x])
+def codes_mask(values: ndarray, codes: ndarray) -> ndarray:
+    # membership of the integer codes looked up in a boolean table instead of a hash set
+    table = np.zeros(max(values.max(initial=-1), codes.max(initial=-1)) + 1, dtype=bool)
+    table[codes] = True
+    return table[values]
 
 
-def df_to_matrix(df: DataFrame, n_items: int) -> csr_matrix:
-    n_users = df["user"].max() + 1
-    rows, cols, values = df["user"], df["item"], df["value"]
+def reindex_data(df: DataFrame, user_lookup: ndarray, item_lookup: ndarray) -> None:
+    df["user"] = user_lookup[df["user"].to_numpy()]
+    df["item"] = item_lookup[df["item"].to_numpy()]
 
-    return csr_matrix(
-        (values, (rows, cols)),
-        dtype="float64",
+
+def df_to_matrix(df: DataFrame, n_users: int, n_items: int) -> csr_matrix:
+    rows, cols, values = df["user"].to_numpy(), df["item"].to_numpy(), df["value"].to_numpy()
+
+    # sort the interactions by user and item and assemble the CSR arrays directly,
+    # which skips the conversion from the COO format
+    order = np.lexsort((cols, rows))
+    index_dtype = np.int32 if rows.shape[0] <= np.iinfo(np.int32).max else np.int64
+    indptr = np.zeros(n_users + 1, dtype=index_dtype)
+    np.cumsum(np.bincount(rows, minlength=n_users), out=indptr[1:])
+
+    # single precision values and 32-bit indices halve the memory traffic of all the CSR scans
+    matrix = csr_matrix(
+        (values[order].astype(np.float32), cols[order].astype(index_dtype), indptr),
         shape=(n_users, n_items),
     )
+    # repeated interactions are summed up as the COO conversion would do
+    matrix.sum_duplicates()
 
+    return matrix
 
-def matrix_to_df(matrix: csr_matrix) -> DataFrame:
-    coo = matrix.tocoo()
-    return pd.DataFrame(
-        data={"user": coo.row, "item": coo.col, "value": coo.data},
-        columns=["user", "item", "value"],
-    )
+
+def number_dtype(params: dtypes.Number) -> Any:
+    # the missing numbers are kept only without the empty value, so the
+    # integers need the nullable type as numpy integers can not be missing
+    if params.empty_value is None and pd.api.types.is_integer_dtype(params.data_type):
+        return "Int64"
+
+    return params.data_type
+
+
+# the interactions are read with fixed compact types instead of letting pandas infer them
+SPLIT_DTYPES = {"user": np.int32, "item": np.int32, "value": np.float32}
 
 
 def build_index(ids) -> frozenbidict:
-    return frozenbidict((uid, i) for (i, uid) in enumerate(ids))
+    ids = list(ids)
+    index = dict(zip(ids, range(len(ids))))
+
+    if len(index) != len(ids):
+        raise ValueError("The index can not be built from duplicated ids.")
+
+    return frozenbidict(index)
 
 
 def load_index(file_path: str) -> frozenbidict:
     with open(file_path, "r") as f:
-        return frozenbidict({line.strip(): i for i, line in enumerate(f)})
+        return build_index(map(str.strip, f.read().splitlines()))
 
 
 def save_index(index_dict: frozenbidict, file_path: str) -> None:
@@ -90,33 +137,38 @@ def save_index(index_dict: frozenbidict, file_path: str) -> None:
 
 
 def save_split(split_name: str, split: Split, output_dir: str) -> None:
-    train_data_path = os.path.join(output_dir, f"{split_name}_train.csv")
-    holdout_data_path = os.path.join(output_dir, f"{split_name}_holdout.csv")
+    train_data_path = os.path.join(output_dir, f"{split_name}_train.npz")
+    holdout_data_path = os.path.join(output_dir, f"{split_name}_holdout.npz")
     user_index_path = os.path.join(output_dir, f"{split_name}_users.txt")
 
-    train_data = matrix_to_df(split.train_matrix)
-    train_data.to_csv(train_data_path, index=False)
+    # the CSR arrays are stored as they are, the checkpoint archive compresses them anyway
+    save_npz(train_data_path, split.train_matrix, compressed=False)
 
     if split.holdout_matrix is not None:
-        holdout_data = matrix_to_df(split.holdout_matrix)
-        holdout_data.to_csv(holdout_data_path, index=False)
+        save_npz(holdout_data_path, split.holdout_matrix, compressed=False)
 
     save_index(split.user_index, user_index_path)
 
 
-def load_split(split_name: str, input_dir: str) -> Tuple[frozenbidict, DataFrame, Optional[DataFrame]]:
-    train_data_path = os.path.join(input_dir, f"{split_name}_train.csv")
-    holdout_data_path = os.path.join(input_dir, f"{split_name}_holdout.csv")
+def load_split_matrix(data_path: str, n_users: int, n_items: int) -> Optional[csr_matrix]:
+    if os.path.isfile(f"{data_path}.npz"):
+        return load_npz(f"{data_path}.npz").tocsr()
+
+    # splits saved by the older versions are stored as CSV interactions
+    if os.path.isfile(f"{data_path}.csv"):
+        return df_to_matrix(pd.read_csv(f"{data_path}.csv", dtype=SPLIT_DTYPES), n_users, n_items)
+
+    return None
+
+
+def load_split(split_name: str, input_dir: str, n_items: int) -> Tuple[frozenbidict, csr_matrix, Optional[csr_matrix]]:
     user_index_path = os.path.join(input_dir, f"{split_name}_users.txt")
 
-    train_data = pd.read_csv(train_data_path)
     user_index = load_index(user_index_path)
+    train_matrix = load_split_matrix(os.path.join(input_dir, f"{split_name}_train"), len(user_index), n_items)
+    holdout_matrix = load_split_matrix(os.path.join(input_dir, f"{split_name}_holdout"), len(user_index), n_items)
 
-    holdout_data = None
-    if os.path.isfile(holdout_data_path):
-        holdout_data = pd.read_csv(holdout_data_path)
-
-    return user_index, train_data, holdout_data
+    return user_index, train_matrix, holdout_matrix
 
 
 def save_items(items: DataFrame, columns: ColumnDict, item_index: frozenbidict, output_dir: str) -> None:
@@ -138,14 +190,17 @@ def load_items(item_cols: ColumnDict, input_dir: str) -> Tuple[DataFrame, frozen
     index_path = os.path.join(input_dir, "items.txt")
 
     csv_dtypes = {}
+    na_values = {}
     for col, dt in item_cols.items():
         if not isinstance(dt, dtypes.Number):
             csv_dtypes[col] = str
         else:
             params = typing.cast(dtypes.Number, dt)
-            csv_dtypes[col] = params.data_type
+            csv_dtypes[col] = number_dtype(params)
+            if params.empty_value is None:
+                na_values[col] = [""]
 
-    items = pd.read_csv(data_path, dtype=csv_dtypes, keep_default_na=False)
+    items = pd.read_csv(data_path, dtype=csv_dtypes, keep_default_na=False, na_values=na_values)
     items = items.set_index(find_column_by_type(item_cols, dtypes.ItemID))
 
     tag_cols = filter_columns_by_type(item_cols, dtypes.Tag)
@@ -157,37 +212,29 @@ def load_items(item_cols: ColumnDict, input_dir: str) -> Tuple[DataFrame, frozen
     return items, item_index
 
 
-def get_top_tags(items: DataFrame, col: str, n: int = 5) -> Tuple[List[str], List[int]]:
-    tags = items[items[col].str[0] != ""][col]
-
-    if tags.empty:
-        return ([], [])
-
-    labels, counts = np.unique(np.concatenate(tags.values), return_counts=True)
-    indices = (-counts).argsort()
-    labels = labels[indices].tolist()[:n]
-    counts = counts[indices].tolist()[:n]
-    return labels, counts
-
-
-def get_top_categories(items: DataFrame, col: str, n: int = 5) -> Tuple[List[str], List[int]]:
-    categories = items[items[col] != ""][col]
-
-    if categories.empty:
-        return ([], [])
-
-    categories = categories.value_counts()
-    labels = categories.index.tolist()[:n]
-    counts = categories.values.tolist()[:n]
-    return labels, counts
+def get_top_counts(counts: ndarray, labels: List[str], n: int = 5) -> Tuple[List[str], List[int]]:
+    # the most frequent labels go first and the ties are ordered by the label
+    order = np.argsort(-counts, kind="stable")[:n]
+    order = order[counts[order] > 0]
+    return [labels[i] for i in order], counts[order].tolist()
 
 
 class Dataset(ABC):
     items: DataFrame = None
     item_index: frozenbidict = None
+    item_ids: ndarray = None
+    item_positions: ndarray = None
+    item_indices: ndarray = None
+    item_lookup: Index = None
+    user_lookups = {}
     tags = {}
+    tag_matrices = {}
     histograms = {}
     categories = {}
+    category_codes = {}
+    tag_filters = {}
+    split_users = {}
+    user_splits = {}
     splits: Dict[str, Split] = {"train": None, "validation": None, "test": None}
 
     @abstractmethod
@@ -217,11 +264,12 @@ class Dataset(ABC):
         raise Exception("You must implement your custom embeddings method.")
 
     def get_split_by_user(self, uid: str) -> Optional[str]:
-        for key, split in self.splits.items():
-            if split.user_index.get(uid) is not None:
-                return key
+        location = self.user_splits.get(uid)
+        return location[1] if location else None
 
-        return None
+    def locate_user(self, uid: str) -> Optional[Tuple[int, str]]:
+        # the index of the user together with its split
+        return self.user_splits.get(uid)
 
     def get_title_col(self) -> str:
         return find_column_by_type(self.item_cols(), dtypes.Title)
@@ -232,6 +280,35 @@ class Dataset(ABC):
     def item_index_to_id(self, index: int) -> str:
         return self.item_index.inverse.get(index)
 
+    def item_ids_to_indices(self, ids: List[str]) -> ndarray:
+        # the ids not found are marked by -1
+        return self.item_lookup.get_indexer(ids)
+
+    def _get_user_lookup(self, split: str) -> Index:
+        # ids of the users ordered by their indices
+        if split not in self.user_lookups:
+            user_index = self.splits.get(split).user_index
+            user_ids = np.empty(len(user_index), dtype=object)
+            user_ids[list(user_index.values())] = list(user_index.keys())
+            self.user_lookups[split] = pd.Index(user_ids)
+
+        return self.user_lookups[split]
+
+    def item_ids_to_positions(self, ids: List[str]) -> ndarray:
+        # rows of the items in the data frame, the ids not found are marked by -1
+        return self.items.index.get_indexer(ids)
+
+    def user_ids_to_indices(self, ids: List[str], split: str) -> ndarray:
+        # the ids not found are marked by -1
+        return self._get_user_lookup(split).get_indexer(ids)
+
+    def user_indices_to_ids(self, indices: ndarray, split: str) -> List[str]:
+        return self._get_user_lookup(split)[indices].tolist()
+
+    def item_positions_to_indices(self, positions: ndarray) -> ndarray:
+        # the items missing in the index are marked by -1
+        return self.item_indices[positions]
+
     def user_id_to_index(self, uid: str, split: str) -> int:
         return self.splits.get(split).user_index.get(uid)
 
@@ -259,7 +336,10 @@ class Dataset(ABC):
         return self.items.shape[0]
 
     def get_users_by_split(self, split: str) -> List[str]:
-        return list(self.splits.get(split).user_index.keys())
+        if split not in self.split_users:
+            self.split_users[split] = list(self.splits.get(split).user_index.keys())
+
+        return self.split_users[split]
 
     def get_items_by_title(self, query: str) -> DataFrame:
         col = self.get_title_col()
@@ -268,22 +348,26 @@ class Dataset(ABC):
         return self.items[item_filter]
 
     def get_interactions_by_user(self, uid: str, split: str) -> csr_matrix:
-        index = self.user_id_to_index(uid, split)
+        return self.get_interactions_by_index(self.user_id_to_index(uid, split), split)
+
+    def get_interactions_by_index(self, index: int, split: str) -> csr_matrix:
         matrix = self.splits.get(split).complete_matrix
 
         return matrix[index]
 
     def get_interacted_items_by_user(self, uid: str, split: str) -> DataFrame:
-        interactions = self.get_interactions_by_user(uid, split)
+        return self.get_interacted_items_by_index(self.user_id_to_index(uid, split), split)
+
+    def get_interacted_items_by_index(self, index: int, split: str) -> DataFrame:
+        interactions = self.get_interactions_by_index(index, split)
         indices = (interactions > 0).indices
-        ids = list(map(self.item_index_to_id, indices))
 
-        return self.items.loc[ids]
+        return self.items.iloc[self.item_positions[indices]]
 
     def item_indices_to_matrix(self, indices: List[int]) -> csr_matrix:
         return csr_matrix(
             (np.ones_like(indices), (np.zeros_like(indices), indices)),
-            dtype="float64",
+            dtype=np.float32,
             shape=(1, self.get_total_items()),
         )
 
@@ -291,10 +375,13 @@ class Dataset(ABC):
         matrix = self.splits.get(split).train_matrix
         tfidf = self.weight_transformer.transform(matrix[indices])
         weights = np.asarray(tfidf.sum(axis=0)).squeeze()
-        sort_indices = (-weights).argsort()[:n]
-        item_ids = list(map(self.item_index_to_id, sort_indices))
 
-        return self.items.loc[item_ids]
+        # sort only the top n items instead of the whole catalog
+        n = min(n, weights.shape[0])
+        top_indices = np.argpartition(-weights, n - 1)[:n]
+        sort_indices = top_indices[np.argsort(-weights[top_indices])]
+
+        return self.items.iloc[self.item_positions[sort_indices]]
 
     def get_users_by_interacted_items(self, indices: List[int], split: str, min_interacts: int = 5) -> List[str]:
         matrix = self.splits.get(split).complete_matrix
@@ -303,54 +390,107 @@ class Dataset(ABC):
         user_interacts = matrix_copy.sum(axis=1).A1
         user_indices = np.where(user_interacts > min_interacts)[0]
 
-        if len(user_indices) == 0:
-            return []
+        return self.user_indices_to_ids(user_indices, split)
 
-        user_ids = np.vectorize(self.user_index_iterator(split))(user_indices)
+    def compute_histogram_by_col(self, items: DataFrame, col: str, bins: int = 5) -> Tuple[ndarray, ndarray]:
+        return self.compute_histograms(items, [col], bins)[col]
 
-        return user_ids.tolist()
+    def compute_histograms(
+        self, items: DataFrame, cols: List[str], bins: int = 5
+    ) -> Dict[str, Tuple[ndarray, ndarray]]:
+        item_cols = self.item_cols()
+        # the quantiles of all the columns are computed by a single call
+        quantiles = items[cols].quantile([0.1, 0.9])
 
-    def compute_histogram_by_col(self, items: DataFrame, col: str, bins: int = 5) -> Tuple[ndarray, ndarray]:
-        params = typing.cast(dtypes.Number, self.item_cols().get(col))
-        if params.bins_range:
-            hist_range = params.bins_range
-        else:
-            hist_range = (items[col].quantile(0.1), items[col].quantile(0.9))
+        histograms = {}
+        for col in cols:
+            params = typing.cast(dtypes.Number, item_cols.get(col))
+            if params.bins_range:
+                hist_range = params.bins_range
+            else:
+                hist_range = tuple(quantiles[col])
 
-        values, bins = np.histogram(items[col], range=hist_range, bins=bins)
+            # the missing values are not counted in any of the bins
+            values, col_bins = np.histogram(items[col].dropna().to_numpy(dtype=np.float64), range=hist_range, bins=bins)
 
-        if params.data_type == int or params.data_type == np.int:
-            bins = bins.round(decimals=0)
-        else:
-            bins = bins.round(decimals=2)
+            if params.data_type == int or params.data_type == np.int:
+                col_bins = col_bins.round(decimals=0)
+            else:
+                col_bins = col_bins.round(decimals=2)
 
-        return values, bins
+            histograms[col] = values, col_bins
+
+        return histograms
 
     def filter_items_by_tags(self, col: str, tags: List[str]):
-        items = self.items[self.items[col].apply(lambda x: set(tags).issubset(set(x)))]
-        return items.index.map(self.item_id_to_index)
+        # the items do not change after the update, so the filters are
+        # computed only once and then served from the cache
+        key = (col, frozenset(tags))
+        if key not in self.tag_filters:
+            items = self.items[self.get_tags_mask(col, tags)]
+            self.tag_filters[key] = self.item_ids_to_indices(items.index)
+
+        return self.tag_filters[key]
+
+    def get_tags_mask(self, col: str, tags: List[str]) -> ndarray:
+        # an item matches if it has all the tags, which is counted
+        # over the columns of the tags in the presence matrix
+        tag_indices = pd.Index(self.tags[col]).get_indexer(list(set(tags)))
+
+        if np.any(tag_indices < 0):
+            return np.zeros(self.items.shape[0], dtype=bool)
+
+        counts = np.asarray(self.tag_matrices[col][:, tag_indices].sum(axis=1)).ravel()
+        return counts == tag_indices.shape[0]
+
+    def get_top_tags(self, items: DataFrame, col: str, n: int = 5) -> Tuple[List[str], List[int]]:
+        # the tags are counted over the rows of the presence matrix instead of exploding the lists
+        rows = self.items.index.get_indexer(items.index)
+        counts = np.bincount(self.tag_matrices[col][rows].indices, minlength=len(self.tags[col]))
+        return get_top_counts(counts, self.tags[col], n)
+
+    def get_top_categories(self, items: DataFrame, col: str, n: int = 5) -> Tuple[List[str], List[int]]:
+        codes = self.category_codes[col][self.items.index.get_indexer(items.index)]
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.categories[col]))
+        return get_top_counts(counts, self.categories[col], n)
 
     def filter_items_by_number(self, col: str, range: Tuple[int, int]):
-        items = self.items[(self.items[col] >= range[0]) & (self.items[col] <= range[1])]
-        return items.index.map(self.item_id_to_index)
+        in_range = (self.items[col] >= range[0]) & (self.items[col] <= range[1])
+        items = self.items[in_range.to_numpy(dtype=bool, na_value=False)]
+        return self.item_ids_to_indices(items.index)
 
     def _update_tags(self) -> None:
         cols = filter_columns_by_type(self.item_cols(), dtypes.Tag)
         for col in cols:
-            tags = np.sort(np.unique(np.concatenate(self.items[col].values)))
+            # flatten the tag lists by exploding the column instead of concatenating the object arrays
+            # the exploded tags are indexed by the positions of their item rows
+            exploded = self.items[col].reset_index(drop=True).explode()
+            tags = np.sort(exploded.dropna().unique())
             self.tags[col] = [x for x in tags if x != ""]
 
+            # sparse presence matrix of the tags (in the order of the tags list) for each item row
+            tag_positions = pd.Index(self.tags[col]).get_indexer(exploded.to_numpy())
+            rows = exploded.index.to_numpy()
+            found = tag_positions >= 0
+            matrix = csr_matrix(
+                (np.ones(np.count_nonzero(found), dtype=np.int32), (rows[found], tag_positions[found])),
+                shape=(self.items.shape[0], len(self.tags[col])),
+            )
+            # the same tag listed twice for an item is counted only once
+            matrix.data[:] = 1
+            self.tag_matrices[col] = matrix
+
     def _update_categories(self) -> None:
         cols = filter_columns_by_type(self.item_cols(), dtypes.Category)
         for col in cols:
             categories = np.sort(self.items[col].unique())
             self.categories[col] = [cat for cat in categories if cat != ""]
+            # codes of the categories for each item row, the empty ones are marked by -1
+            self.category_codes[col] = pd.Index(self.categories[col]).get_indexer(self.items[col])
 
     def _update_histograms(self) -> None:
         cols = filter_columns_by_type(self.item_cols(), dtypes.Number)
-        for col in cols:
-            values, bins = self.compute_histogram_by_col(self.items, col)
-            self.histograms[col] = values, bins
+        self.histograms = self.compute_histograms(self.items, cols)
 
     def _update_weighting(self):
         transformer = TfidfTransformer()
@@ -358,22 +498,41 @@ class Dataset(ABC):
         self.weight_transformer = transformer
 
     def _update_data(self, splits, items: DataFrame, item_index: frozenbidict) -> None:
-        n_items = items.shape[0]
-
-        self.splits["train"] = Split(train_matrix=df_to_matrix(splits[0][1], n_items), user_index=splits[0][0])
+        self.splits["train"] = Split(train_matrix=splits[0][1], user_index=splits[0][0])
         self.splits["validation"] = Split(
-            train_matrix=df_to_matrix(splits[1][1], n_items),
-            holdout_matrix=df_to_matrix(splits[1][2], n_items),
+            train_matrix=splits[1][1],
+            holdout_matrix=splits[1][2],
             user_index=splits[1][0],
         )
         self.splits["test"] = Split(
-            train_matrix=df_to_matrix(splits[2][1], n_items),
-            holdout_matrix=df_to_matrix(splits[2][2], n_items),
+            train_matrix=splits[2][1],
+            holdout_matrix=splits[2][2],
             user_index=splits[2][0],
         )
 
         self.items = items
         self.item_index = item_index
+        # ids of the items ordered by their indices, so the indices can be translated by a single gather
+        self.item_ids = np.empty(len(item_index), dtype=object)
+        self.item_ids[list(item_index.values())] = list(item_index.keys())
+        # rows of the items data frame ordered by the item indices for the positional lookups
+        self.item_positions = items.index.get_indexer(self.item_ids)
+        # and the other way around, indices of the items ordered by the rows of the data frame
+        self.item_indices = np.full(items.shape[0], -1)
+        self.item_indices[self.item_positions] = np.arange(self.item_positions.shape[0])
+        self.item_lookup = pd.Index(self.item_ids)
+        self.user_lookups = {}
+        # the tags and categories of each dataset are kept by the instance, so they are never shared with other datasets
+        self.tags = {}
+        self.tag_matrices = {}
+        self.tag_filters = {}
+        self.categories = {}
+        self.category_codes = {}
+        self.split_users = {}
+        # a user found in more splits belongs to the first one, so the splits are merged in the reversed order
+        self.user_splits = {
+            uid: (index, key) for key in reversed(self.splits) for uid, index in self.splits[key].user_index.items()
+        }
 
         self._update_tags()
         self._update_categories()
@@ -405,8 +564,10 @@ class Dataset(ABC):
         interacts_user_col = find_column_by_type(interact_cols, dtypes.UserID)
         interacts_value_col = find_column_by_type(interact_cols, dtypes.Interaction)
 
-        interacts[interacts_item_col] = interacts[interacts_item_col].astype(str)
-        interacts[interacts_user_col] = interacts[interacts_user_col].astype(str)
+        # the ids are factorized just once and the splitting works with their integer codes,
+        # which are sorted the same way as the string ids, so the splits are not affected
+        interacts[interacts_item_col], item_ids = factorize_ids(interacts[interacts_item_col])
+        interacts[interacts_user_col], user_ids = factorize_ids(interacts[interacts_user_col])
 
         if not interacts_value_col:
             interacts["value"] = 1
@@ -432,24 +593,35 @@ class Dataset(ABC):
 
         train_split, vad_split, test_split = splitter.split(interacts)
 
-        train_user_ids, train_data = train_split
-        vad_user_ids, vad_train_data, vad_holdout_data = vad_split
-        test_user_ids, test_train_data, test_holdout_data = test_split
-
-        item_ids = pd.unique(train_data["item"])
-
-        item_index = build_index(item_ids)
-        train_user_index = build_index(train_user_ids)
-        vad_user_index = build_index(vad_user_ids)
-        test_user_index = build_index(test_user_ids)
-
-        reindex_data(train_data, train_user_index, item_index)
-
-        reindex_data(vad_train_data, vad_user_index, item_index)
-        reindex_data(vad_holdout_data, vad_user_index, item_index)
-
-        reindex_data(test_train_data, test_user_index, item_index)
-        reindex_data(test_holdout_data, test_user_index, item_index)
+        train_user_codes, train_data = train_split
+        vad_user_codes, vad_train_data, vad_holdout_data = vad_split
+        test_user_codes, test_train_data, test_holdout_data = test_split
+
+        item_codes = pd.unique(train_data["item"])
+        train_item_ids = item_ids[item_codes]
+
+        item_index = build_index(train_item_ids)
+        train_user_index = build_index(user_ids[train_user_codes])
+        vad_user_index = build_index(user_ids[vad_user_codes])
+        test_user_index = build_index(user_ids[test_user_codes])
+
+        item_lookup = codes_lookup(item_codes, item_ids.shape[0])
+        train_user_lookup = codes_lookup(np.asarray(train_user_codes), user_ids.shape[0])
+        vad_user_lookup = codes_lookup(np.asarray(vad_user_codes), user_ids.shape[0])
+        test_user_lookup = codes_lookup(np.asarray(test_user_codes), user_ids.shape[0])
+
+        # each call gathers the codes of a different data frame, so they can run in parallel,
+        # numpy releases the GIL while indexing the lookup tables
+        with ThreadPoolExecutor() as executor:
+            futures = [
+                executor.submit(reindex_data, train_data, train_user_lookup, item_lookup),
+                executor.submit(reindex_data, vad_train_data, vad_user_lookup, item_lookup),
+                executor.submit(reindex_data, vad_holdout_data, vad_user_lookup, item_lookup),
+                executor.submit(reindex_data, test_train_data, test_user_lookup, item_lookup),
+                executor.submit(reindex_data, test_holdout_data, test_user_lookup, item_lookup),
+            ]
+            for future in futures:
+                future.result()
 
         # keep only columns defined in the dtypes
         items = items[item_cols.keys()]
@@ -463,23 +635,35 @@ class Dataset(ABC):
         items = items.set_index(items_id_col)
 
         # filter only items included in the training data
-        items = items[items.index.isin(item_ids)]
+        items = items[items.index.isin(train_item_ids)]
 
         numeric_cols = filter_columns_by_type(item_cols, dtypes.Number)
         for col in numeric_cols:
             params = typing.cast(dtypes.Number, item_cols.get(col))
-            items[col] = items[col].fillna(params.empty_value)
-            items[col] = items[col].astype(params.data_type)
+            if params.empty_value is not None:
+                items[col] = items[col].fillna(params.empty_value)
+            items[col] = items[col].astype(number_dtype(params))
 
         tag_cols = filter_columns_by_type(item_cols, dtypes.Tag)
         for col in tag_cols:
             params = typing.cast(dtypes.Tag, item_cols[col])
             items[col] = items[col].str.split(params.sep)
 
+        # the shapes are given by the indices, so the interactions are not scanned for them
+        n_items = items.shape[0]
+        n_train_users, n_vad_users, n_test_users = len(train_user_index), len(vad_user_index), len(test_user_index)
         splits = (
-            (train_user_index, train_data),
-            (vad_user_index, vad_train_data, vad_holdout_data),
-            (test_user_index, test_train_data, test_holdout_data),
+            (train_user_index, df_to_matrix(train_data, n_train_users, n_items)),
+            (
+                vad_user_index,
+                df_to_matrix(vad_train_data, n_vad_users, n_items),
+                df_to_matrix(vad_holdout_data, n_vad_users, n_items),
+            ),
+            (
+                test_user_index,
+                df_to_matrix(test_train_data, n_test_users, n_items),
+                df_to_matrix(test_holdout_data, n_test_users, n_items),
+            ),
         )
 
         self._update_data(splits, items, item_index)
@@ -503,9 +687,10 @@ class Dataset(ABC):
         unzip_dir(split_path, tmp_dir_path())
         items, item_index = load_items(self.item_cols(), tmp_dir_path())
 
-        train_split = load_split("train", tmp_dir_path())
-        vad_split = load_split("validation", tmp_dir_path())
-        test_split = load_split("test", tmp_dir_path())
+        n_items = items.shape[0]
+        train_split = load_split("train", tmp_dir_path(), n_items)
+        vad_split = load_split("validation", tmp_dir_path(), n_items)
+        test_split = load_split("test", tmp_dir_path(), n_items)
 
         splits = train_split, vad_split, test_split
 
@@ -578,40 +763,38 @@ class DatasetSplitter:
         return df, user_activity, item_popularity
 
     def _split_holdout(self, df: DataFrame) -> Tuple[DataFrame, DataFrame]:
-        grouped_by_user = df.groupby(self.user_col)
-        train_list, holdout_list = list(), list()
-
-        for i, (_, group) in enumerate(grouped_by_user):
-            n_items = len(group)
-
-            # randomly choose 20% of all items user interacted with
-            # these interactions goes to test list, other goes to training list
-            indices = np.zeros(n_items, dtype="bool")
-            holdout_size = math.ceil(self.test_holdout_prop * n_items)
+        # sort the interactions by user, keeping the original order within the users
+        users = df[self.user_col].values
+        order = np.argsort(users, kind="stable")
+        df = df.iloc[order]
 
-            if holdout_size > 0:
-                set_seed(self.seed)
-                rand_items = np.random.choice(n_items, size=holdout_size, replace=False).astype("int64")
-                indices[rand_items] = True
+        _, starts, counts = np.unique(users[order], return_index=True, return_counts=True)
+        groups = np.repeat(np.arange(counts.shape[0]), counts)
 
-                train_list.append(group[np.logical_not(indices)])
-                holdout_list.append(group[indices])
+        # rank the interactions of each user in a random order, all users are
+        # sampled at once from a single seeded draw instead of one by one
+        rng = np.random.default_rng(self.seed)
+        rand = rng.random(df.shape[0])
+        ranks = np.empty(df.shape[0], dtype=np.int64)
+        ranks[np.lexsort((rand, groups))] = np.arange(df.shape[0]) - np.repeat(starts, counts)
 
-                if i % 1000 == 0 and i > 0:
-                    logger.info(f"{i} users sampled")
+        # randomly choose 20% of all items user interacted with
+        # these interactions goes to test list, other goes to training list
+        holdout_sizes = np.ceil(self.test_holdout_prop * counts).astype(np.int64)
+        holdout_mask = ranks < np.repeat(holdout_sizes, counts)
 
-        train_data = pd.concat(train_list)
-        holdout_data = pd.concat(holdout_list)
+        logger.info(f"{counts.shape[0]} users sampled")
 
-        return train_data, holdout_data
+        return df[~holdout_mask], df[holdout_mask]
 
     # we will only be working with movies that has been seen by the model, so we need
     # to remove all interactions to movies out of the training scope
     def _filter_interact_data(self, df: DataFrame, user_index: Index, item_index: Index) -> Tuple[DataFrame, Index]:
-        # filter only interactions made by users
-        df = df.loc[df[self.user_col].isin(user_index)]
-        # filter only interactions with items included in the item index
-        df = df.loc[df[self.item_col].isin(item_index)]
+        # filter only interactions made by users and with items included in the item index,
+        # the ids are integer codes here, so both filters are combined into a single mask
+        user_mask = codes_mask(df[self.user_col].to_numpy(), np.asarray(user_index))
+        item_mask = codes_mask(df[self.item_col].to_numpy(), np.asarray(item_index))
+        df = df.loc[user_mask & item_mask]
         # filter only interactions meet the main criteria
         # this way we ensure there will be no vad/test user with less
         # than x interactions (this could cause some user gets into the vad-tr set
@@ -627,8 +810,8 @@ class DatasetSplitter:
         user_index = user_activity.index
 
         # shuffle users using permutation
-        set_seed(self.seed)
-        index_perm = np.random.permutation(user_index.size)
+        rng = np.random.default_rng(self.seed)
+        index_perm = rng.permutation(user_index.size)
         # user_index is an array of shuffled users ids
         user_index = user_index[index_perm]
 
@@ -642,7 +825,7 @@ class DatasetSplitter:
         test_users = user_index[(n_users - n_holdout_users) :]
 
         # select only interactions made by users from the training set
-        train_data = df.loc[df[self.user_col].isin(train_users)]
+        train_data = df.loc[codes_mask(df[self.user_col].to_numpy(), np.asarray(train_users))]
         item_index = pd.unique(train_data[self.item_col])
 
         # select only interactions made by the validation users
@@ -32,9 +32,10 @@ class Number(DataType):
     def __init__(
         self,
         data_type: Any = float,
-        empty_value: int = 0,
+        empty_value: Optional[int] = 0,
         bins_range: Optional[Tuple[int, int]] = None,
     ):
+        # the missing values are filled by the empty value, or kept missing if it is None
         self.bins_range = bins_range
         self.empty_value = empty_value
         self.data_type = data_type
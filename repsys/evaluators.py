@@ -17,7 +17,7 @@ from scipy.sparse import issparse, csr_matrix
 from sklearn.decomposition import PCA
 from sklearn.manifold import TSNE
 
-from repsys.dataset import Dataset
+from repsys.dataset import Dataset, Split
 from repsys.constants import CURRENT_VERSION
 from repsys.helpers import (
     tmp_dir_path,
@@ -38,6 +38,7 @@ from repsys.metrics import (
     get_coverage,
     get_clt,
     get_ndcg,
+    get_idcg,
     get_novelty,
 )
 from repsys.model import Model
@@ -108,6 +109,7 @@ class ModelEvaluator:
         novelty_k: List[int] = None,
         percentage_lt_k: List[int] = None,
         coverage_lt_k: List[int] = None,
+        batch_size: int = 1024,
     ):
         if precision_recall_k is None:
             precision_recall_k = [20, 50]
@@ -137,6 +139,7 @@ class ModelEvaluator:
         self.novelty_k = novelty_k
         self.plt_k = percentage_lt_k
         self.clt_k = coverage_lt_k
+        self.batch_size = batch_size
 
         self.evaluated_models: List[str] = []
 
@@ -146,17 +149,16 @@ class ModelEvaluator:
         self._summary_results: Dict[str, List[DataFrame]] = {}
         self._version: str = CURRENT_VERSION
 
-    def compute_metrics(self, X_predict: ndarray, X_true: ndarray) -> Tuple[Dict[str, float], Dict[str, ndarray]]:
-        X_train = self._dataset.get_train_data()
-        max_k = max(
+    def _max_k(self) -> int:
+        return max(
             self.pr_k + self.ndcg_k + self.coverage_k + self.diversity_k + self.novelty_k + self.plt_k + self.clt_k
         )
 
-        logger.info(f"Sorting item predictions for the maximal K={max_k}")
-        predict_sort_indices = sort_partially(-X_predict, k=max_k)
-
-        logger.info(f"Sorting true interactions for the maximal K={max_k}")
-        true_sort_indices = sort_partially(-X_true, k=max_k)
+    def compute_metrics(
+        self, predict_sort_indices: ndarray, test_split: Split
+    ) -> Tuple[Dict[str, float], Dict[str, ndarray]]:
+        X_train = self._dataset.get_train_data()
+        X_true = test_split.holdout_matrix
 
         logger.info("Computing short-head/long-tail items")
         item_popularity = np.asarray((X_train > 0).sum(axis=0)).squeeze()
@@ -168,7 +170,9 @@ class ModelEvaluator:
         logger.info("Computing precision and recall")
         precision_dict, recall_dict = dict(), dict()
         for k in self.pr_k:
-            precision_dict[k], recall_dict[k] = get_precision_recall(X_predict, X_true, predict_sort_indices, k)
+            precision_dict[k], recall_dict[k] = get_precision_recall(
+                X_true, test_split.holdout_nonzero, predict_sort_indices, k
+            )
 
         for k in self.pr_k:
             user_results[f"Recall@{k}"] = recall_dict.get(k)
@@ -176,13 +180,16 @@ class ModelEvaluator:
 
         logger.info("Computing NDCG")
         for k in self.ndcg_k:
-            ndcg = get_ndcg(X_predict, X_true, predict_sort_indices, true_sort_indices, k)
+            if k not in test_split.holdout_idcg:
+                test_split.holdout_idcg[k] = get_idcg(X_true, k)
+
+            ndcg = get_ndcg(X_true, test_split.holdout_idcg[k], predict_sort_indices, k)
             user_results[f"NDCG@{k}"] = ndcg
             summary_results[f"NDCG@{k}"] = ndcg.mean()
 
         logger.info("Computing catalog coverage")
         for k in self.coverage_k:
-            coverage = get_coverage(X_predict, predict_sort_indices, k)
+            coverage = get_coverage(X_train.shape[1], predict_sort_indices, k)
             summary_results[f"Coverage@{k}"] = coverage
 
         logger.info("Computing user diversity")
@@ -212,10 +219,6 @@ class ModelEvaluator:
             user_results[f"Precision@{k}"] = precision_dict.get(k)
             summary_results[f"Precision@{k}"] = precision_dict.get(k).mean()
 
-        logger.info("Computing MAE, MSE and RMSE")
-        mae, mse, rmse = get_error_metrics(X_predict, X_true)
-        user_results["MAE"], user_results["MSE"], user_results["RMSE"] = mae, mse, rmse
-
         # logger.info("Computing item popularity")
         # item_results["Popularity"] = get_item_pop(X_predict)
 
@@ -261,25 +264,41 @@ class ModelEvaluator:
 
     def evaluate(self, model: Model, split: str = "validation"):
         test_split = self._dataset.splits.get(split)
-        X_true = test_split.holdout_matrix.toarray()
+        X_true = test_split.holdout_matrix
+
+        max_k = self._max_k()
+
+        # the predictions are computed in batches of users, only their top-k indices
+        # and the error metrics are kept, so the whole prediction matrix never exists,
+        # the models depending on the whole input must predict all the users at once
+        logger.info(f"Computing predictions sorted for the maximal K={max_k}")
+        n_users = test_split.train_matrix.shape[0]
+        batch_size = self.batch_size if model.batchable else max(n_users, 1)
+        sort_batches, error_batches = [], []
+        for i in range(0, n_users, batch_size):
+            X_predict = model.predict(test_split.train_matrix[i : i + batch_size])
 
-        logger.info("Computing predictions")
-        X_predict = model.predict(test_split.train_matrix)
+            if isinstance(X_predict, np.matrix):
+                X_predict = X_predict.getA()
 
-        if np.any(np.isinf(X_predict)):
-            logger.warning("The predictions should not contain infinite values")
-            logger.warning("They will be replaced by 0 and 1 for the purpose of the evaluation.")
+            if not isinstance(X_predict, np.ndarray):
+                raise ValueError(f"Model {model} predicts {type(X_predict)}, but only np.ndarray is now supported")
 
-        if isinstance(X_predict, np.matrix):
-            X_predict = X_predict.getA()
+            if np.any(np.isinf(X_predict)):
+                logger.warning("The predictions should not contain infinite values")
+                logger.warning("They will be replaced by 0 and 1 for the purpose of the evaluation.")
 
-        if not isinstance(X_predict, np.ndarray):
-            raise ValueError(f"Model {model} predicts {type(X_predict)}, but only np.ndarray is now supported")
+            X_predict[X_predict == -np.inf] = 0
+            X_predict[X_predict == np.inf] = 1
 
-        X_predict[X_predict == -np.inf] = 0
-        X_predict[X_predict == np.inf] = 1
+            sort_batches.append(sort_partially(-X_predict, k=max_k))
+            error_batches.append(get_error_metrics(X_predict, X_true[i : i + batch_size]))
 
-        summary_results, user_results = self.compute_metrics(X_predict, X_true)
+        summary_results, user_results = self.compute_metrics(np.concatenate(sort_batches), test_split)
+
+        logger.info("Computing MAE, MSE and RMSE")
+        mae, mse, rmse = (np.concatenate(errors) for errors in zip(*error_batches))
+        user_results["MAE"], user_results["MSE"], user_results["RMSE"] = mae, mse, rmse
 
         user_ids = list(test_split.user_index.keys())
         user_df = results_to_df(user_results, user_ids)
@@ -449,7 +468,7 @@ class DatasetEvaluator:
         else:
             indices = np.arange(embeds.shape[0])
 
-        ids = np.vectorize(self._dataset.user_index_iterator(split))(indices)
+        ids = self._dataset.user_indices_to_ids(indices, split)
         self.user_embeddings[split] = embeddings_to_df(embeds, ids)
 
     def compute_item_embeddings(self, method: str = "pymde", model: Model = None):
@@ -463,8 +482,7 @@ class DatasetEvaluator:
 
         embeds = self._compute_embeddings(X, method, custom_embeddings)
 
-        indices = np.arange(embeds.shape[0])
-        ids = np.vectorize(self._dataset.item_index_to_id)(indices)
+        ids = self._dataset.item_ids[: embeds.shape[0]]
         self.item_embeddings = embeddings_to_df(embeds, ids)
 
     @tmpdir_provider
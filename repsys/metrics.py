@@ -1,21 +1,31 @@
 from typing import Tuple
 
+import numba
 import numpy as np
 from numpy import ndarray
 from scipy.sparse import csr_matrix
-from sklearn.preprocessing import MinMaxScaler
+from sklearn.preprocessing import MinMaxScaler, normalize
 
 
-def get_precision_recall(X_predict: ndarray, X_true: ndarray, sort_indices: ndarray, k: int) -> Tuple[ndarray, ndarray]:
-    row_indices = np.arange(X_predict.shape[0])[:, np.newaxis]
+@numba.njit(parallel=True, cache=True)
+def count_hits(indptr, indices, data, sort_indices, k, hits):
+    # look up the holdout items of each user directly in the CSR arrays
+    # and count those appearing among the user's top-k predictions
+    for u in numba.prange(sort_indices.shape[0]):
+        for p in range(indptr[u], indptr[u + 1]):
+            if data[p] <= 0:
+                continue
+            for j in range(k):
+                if sort_indices[u, j] == indices[p]:
+                    hits[u] += 1
+                    break
 
-    X_true_bin = X_true > 0
-    X_true_nonzero = (X_true > 0).sum(axis=1)
 
-    X_predict_bin = np.zeros_like(X_predict, dtype=bool)
-    X_predict_bin[row_indices, sort_indices[:, :k]] = True
-
-    hits = (np.logical_and(X_true_bin, X_predict_bin).sum(axis=1)).astype(np.float32)
+def get_precision_recall(
+    X_true: csr_matrix, X_true_nonzero: ndarray, sort_indices: ndarray, k: int
+) -> Tuple[ndarray, ndarray]:
+    hits = np.zeros(X_true.shape[0], dtype=np.float32)
+    count_hits(X_true.indptr, X_true.indices, X_true.data, np.ascontiguousarray(sort_indices), k, hits)
 
     precision = hits / k
     recall = hits / np.minimum(k, X_true_nonzero)
@@ -23,46 +33,61 @@ def get_precision_recall(X_predict: ndarray, X_true: ndarray, sort_indices: ndar
     return precision, recall
 
 
-def get_ndcg(
-    X_predict: ndarray,
-    X_true: ndarray,
-    sort_indices: ndarray,
-    true_sort_indices: ndarray,
-    k: int,
-) -> ndarray:
-    row_indices = np.arange(X_predict.shape[0])[:, np.newaxis]
+@numba.njit(parallel=True, cache=True)
+def sum_dcg(indptr, indices, data, sort_indices, discount, dcg):
+    # discount the holdout values of the items found among the user's top-k predictions
+    for u in numba.prange(sort_indices.shape[0]):
+        for p in range(indptr[u], indptr[u + 1]):
+            for j in range(discount.shape[0]):
+                if sort_indices[u, j] == indices[p]:
+                    dcg[u] += data[p] * discount[j]
+                    break
+
+
+@numba.njit(parallel=True, cache=True)
+def sum_idcg(indptr, data, discount, idcg):
+    # the ideal ranking puts the highest holdout values of each user first
+    for u in numba.prange(indptr.shape[0] - 1):
+        values = np.sort(data[indptr[u] : indptr[u + 1]])[::-1]
+        for j in range(min(discount.shape[0], values.shape[0])):
+            if values[j] <= 0:
+                break
+            idcg[u] += values[j] * discount[j]
 
-    X_true_bin = X_true > 0
-    X_true_nonzero = X_true_bin.sum(axis=1)
 
+def get_idcg(X_true: csr_matrix, k: int) -> ndarray:
     discount = 1.0 / np.log2(np.arange(2, k + 2))
-    dcg = (X_true[row_indices, sort_indices[:, :k]] * discount).sum(axis=1)
 
-    mask = np.transpose(np.arange(k)[:, np.newaxis] < np.minimum(k, X_true_nonzero))
-    idcg = np.where(mask, (X_true[row_indices, true_sort_indices] * discount), 0).sum(axis=1)
+    idcg = np.zeros(X_true.shape[0])
+    sum_idcg(X_true.indptr, X_true.data, discount, idcg)
+
+    return idcg
+
+
+def get_ndcg(X_true: csr_matrix, idcg: ndarray, sort_indices: ndarray, k: int) -> ndarray:
+    discount = 1.0 / np.log2(np.arange(2, k + 2))
+
+    dcg = np.zeros(X_true.shape[0])
+    sum_dcg(X_true.indptr, X_true.indices, X_true.data, np.ascontiguousarray(sort_indices[:, :k]), discount, dcg)
 
     return dcg / idcg
 
 
-def get_coverage(X_predict: ndarray, sort_indices: ndarray, k: int) -> float:
-    n_covered_items = len(np.unique(np.concatenate(sort_indices[:, :k])))
-    n_items = X_predict.shape[1]
+def get_coverage(n_items: int, sort_indices: ndarray, k: int) -> float:
+    n_covered_items = len(np.unique(sort_indices[:, :k]))
 
     return n_covered_items / n_items
 
 
 def get_diversity(embeddings: csr_matrix, sort_indices: ndarray, k: int) -> ndarray:
+    # the item vectors are normalized only once, so for each user just the k
+    # recommended rows are gathered instead of the k*k rows of all the pairs
+    item_embeddings = normalize(embeddings.T.tocsr())
+
     def f(idx):
-        pairs = np.array(np.meshgrid(idx, idx)).T.reshape(-1, 2)
-        embs_0 = embeddings.T[pairs[:, 0]].toarray()  # np array of shape (k*k, emb_size)
-        embs_1 = embeddings.T[pairs[:, 1]].toarray()  # np array of shape (k*k, emb_size)
-        # Compute cosine distance between (embs_0[0], embs_1[0]), (embs_0[1], embs_1[1]), (embs_0[2], embs_1[2]), ...
-        #   as normalized embs_0 * normalized embs_1 and sum over axis 1
-        dist = 1 - np.sum(
-            (embs_0 / np.linalg.norm(embs_0, axis=1)[:, np.newaxis])
-            * (embs_1 / np.linalg.norm(embs_1, axis=1)[:, np.newaxis]),
-            axis=1,
-        )
+        embs = item_embeddings[idx]
+        # cosine distances between all pairs (i, j) of the recommended items
+        dist = 1 - embs.dot(embs.T).toarray()
         return dist.sum()
 
     vf = np.vectorize(f, signature="(n)->()")
@@ -84,11 +109,22 @@ def get_novelty(X_train: csr_matrix, sort_indices: ndarray, k: int) -> ndarray:
     return novelty / (k * max_novelty)
 
 
-def get_error_metrics(X_predict: ndarray, X_true: ndarray) -> Tuple[float, float, float]:
-    diff = X_true - X_predict
+def get_error_metrics(X_predict: ndarray, X_true: csr_matrix) -> Tuple[float, float, float]:
+    n_users, n_items = X_predict.shape
+
+    # the errors are summed up as if all true values were zero and then corrected
+    # only at the holdout entries, so the holdout is never densified
+    rows = np.repeat(np.arange(n_users), np.diff(X_true.indptr))
+    predicted = X_predict[rows, X_true.indices]
+    diff = X_true.data - predicted
+
+    abs_errors = np.abs(X_predict).sum(axis=1, dtype=np.float64)
+    abs_errors += np.bincount(rows, weights=np.abs(diff) - np.abs(predicted), minlength=n_users)
+    square_errors = np.square(X_predict).sum(axis=1, dtype=np.float64)
+    square_errors += np.bincount(rows, weights=np.square(diff) - np.square(predicted), minlength=n_users)
 
-    mae = np.abs(diff).mean(axis=1)
-    mse = np.square(diff).mean(axis=1)
+    mae = abs_errors / n_items
+    mse = square_errors / n_items
     rmse = np.sqrt(mse)
 
     return mae, mse, rmse
@@ -115,7 +151,7 @@ def get_plt(sort_indices: ndarray, long_tail_items: ndarray, k: int) -> ndarray:
 
 
 def get_clt(sort_indices: ndarray, long_tail_items: ndarray, k: int) -> float:
-    covered_items = np.unique(np.concatenate(sort_indices[:, :k]))
+    covered_items = np.unique(sort_indices[:, :k])
     tail_covered = len(np.intersect1d(covered_items, long_tail_items, assume_unique=True))
 
     return tail_covered / long_tail_items.shape[0]
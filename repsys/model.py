@@ -16,6 +16,9 @@ logger = logging.getLogger(__name__)
 class Model(ABC):
     dataset: Dataset = None
     config: Config = None
+    # the server predicts the concurrent requests together only if the
+    # predictions of the users do not depend on the other users of the input
+    batchable: bool = False
 
     @abstractmethod
     def name(self) -> str:
@@ -40,12 +43,16 @@ class Model(ABC):
         return {}
 
     def predict_top_items(self, X: csr_matrix, n=20, **kwargs):
-        prediction = self.predict(X, **kwargs)
-        indices = (-prediction).argsort()[:, :n]
-        top_items = np.vectorize(self.dataset.item_index_to_id)(indices)
-        if isinstance(top_items, np.matrix):
-            top_items = top_items.getA()
-        return top_items
+        prediction = np.asarray(self.predict(X, **kwargs))
+
+        # partition the predictions first and sort only the top n items of each user
+        n = min(n, prediction.shape[1])
+        row_indices = np.arange(prediction.shape[0])[:, np.newaxis]
+        top_indices = np.argpartition(-prediction, n - 1, axis=1)[:, :n]
+        sort_indices = np.argsort(-prediction[row_indices, top_indices], axis=1)
+        indices = top_indices[row_indices, sort_indices]
+
+        return self.dataset.item_ids[indices]
 
     def to_dict(self):
         return {"params": {key: param.to_dict() for key, param in self.web_params().items()}}
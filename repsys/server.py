@@ -1,24 +1,49 @@
+import asyncio
 import logging
 import os
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, lru_cache
+from typing import Dict, Any, List
 import random
 
+import numba
 import numpy as np
+import pandas as pd
 from pandas import DataFrame
 from sanic import Sanic
+from scipy.sparse import csr_matrix, vstack
 from sanic.exceptions import InvalidUsage, NotFound
-from sanic.response import json, file
+from sanic.response import json, html, raw
 
+import repsys.constants as const
 import repsys.dtypes as dtypes
 from repsys.config import Config
-from repsys.dataset import Dataset, get_top_tags, get_top_categories
+from repsys.dataset import Dataset
 from repsys.dtypes import filter_columns_by_type
 from repsys.evaluators import DatasetEvaluator, ModelEvaluator
 from repsys.model import Model
 from repsys.helpers import set_seed
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+SPLIT_NAMES = frozenset(["train", "validation", "test"])
+
+
+def orjson_dumps(body: Any, **kwargs) -> bytes:
+    # numpy arrays and scalars are serialized natively
+    return orjson.dumps(body, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+@numba.njit(parallel=True, cache=True)
+def start_numba_threads(x):
+    for i in numba.prange(x.shape[0]):
+        x[i] = i
+
 
 def create_app(
     models: Dict[str, Model],
@@ -27,28 +52,133 @@ def create_app(
     model_eval: ModelEvaluator,
     config: Config,
 ) -> Sanic:
-    app = Sanic("repsys", configure_logging=False)
+    # the faster orjson encoder is used for all the responses if it is installed
+    app = Sanic("repsys", configure_logging=False, dumps=orjson_dumps if orjson is not None else None)
+
+    # the CPU heavy work runs in threads, so the event loop keeps serving other requests,
+    # the models are not required to be thread-safe, so the predictions run one by one
+    app.ctx.executor = ThreadPoolExecutor()
+    app.ctx.predict_executor = ThreadPoolExecutor(max_workers=1)
+
+    # the TBB threading layer of numba hangs at the exit of the process if its first parallel
+    # kernel (e.g. of a model) is launched from a thread of the executors, so it is started here
+    start_numba_threads(np.zeros(1))
+
+    async def run_in_executor(executor: ThreadPoolExecutor, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(executor, partial(func, *args, **kwargs))
+
+    async def predict_user_top_items(model: Model, input_data: csr_matrix, limit: int, params: Dict[str, Any]):
+        ids = await run_in_executor(app.ctx.predict_executor, model.predict_top_items, input_data, limit, **params)
+        return ids[0]
+
+    # the predictions requested within a short window are computed by a single call of the model,
+    # only the requests of the same model with the same limit and parameters can share a batch
+    predict_batches: Dict[str, Dict[str, Any]] = {}
+
+    async def predict_batch(key: str) -> None:
+        batch = predict_batches.pop(key, None)
+        if batch is None:
+            return
+
+        # the batch may be flushed before its window ends, so the timer must not flush a newer batch
+        batch["timer"].cancel()
+
+        model = models.get(batch["model"])
+        requests = batch["requests"]
+        try:
+            X = vstack([input_data for input_data, _ in requests], format="csr")
+            ids = await run_in_executor(
+                app.ctx.predict_executor, model.predict_top_items, X, batch["limit"], **batch["params"]
+            )
+        except Exception:
+            # a failing request must not fail the others, so each one is predicted on its own
+            for input_data, future in requests:
+                try:
+                    user_ids = await predict_user_top_items(model, input_data, batch["limit"], batch["params"])
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(user_ids)
+            return
+
+        # the requests cancelled in the meantime (e.g. by a disconnected client) are skipped
+        for i, (_, future) in enumerate(requests):
+            if not future.done():
+                future.set_result(ids[i])
+
+    async def predict_top_items(
+        model_name: str, input_data: csr_matrix, limit: int, params: Dict[str, Any]
+    ) -> List[str]:
+        model = models.get(model_name)
+
+        # the users can be predicted together only if their predictions do not depend on each other
+        if not model.batchable or input_data.shape != (1, dataset.get_total_items()):
+            return await predict_user_top_items(model, input_data, limit, params)
+
+        loop = asyncio.get_running_loop()
+        key = repr((model_name, limit, sorted(params.items())))
+
+        if key not in predict_batches:
+            timer = loop.call_later(const.PREDICT_BATCH_WINDOW, lambda: asyncio.ensure_future(predict_batch(key)))
+            predict_batches[key] = {
+                "model": model_name,
+                "limit": limit,
+                "params": params,
+                "requests": [],
+                "timer": timer,
+            }
+
+        future = loop.create_future()
+        requests = predict_batches[key]["requests"]
+        requests.append((input_data, future))
+
+        if len(requests) >= const.PREDICT_BATCH_SIZE:
+            asyncio.ensure_future(predict_batch(key))
+
+        return await future
 
     static_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "web", "build")
-    app.static(
-        "/",
-        static_folder,
-        pattern=r"/^[^.]+$|.(?!(css|gif|ico|jpg|js|png|txt|svg|woff|ttf)$)([^.]+$)/",
-    )
+    # the files of the build are matched by the path prefix only,
+    # the routes of the web app are registered explicitly below
+    app.static("/", static_folder, resource_type="dir")
+
+    # the dataset does not change while the server is running,
+    # so its columns are split by the data types only once
+    item_cols = dataset.item_cols()
+    item_col_types = {col: type(datatype) for col, datatype in item_cols.items()}
+    tag_cols = filter_columns_by_type(item_cols, dtypes.Tag)
+    category_cols = filter_columns_by_type(item_cols, dtypes.Category)
+    number_cols = filter_columns_by_type(item_cols, dtypes.Number)
 
     def serialize_items(items: DataFrame):
-        items_copy = items.copy()
-        items_copy["id"] = items_copy.index
-
-        tag_cols = filter_columns_by_type(dataset.item_cols(), dtypes.Tag)
-        for col in tag_cols:
-            items_copy[col] = items_copy[col].str.join(", ")
+        # the records are patched directly instead of copying the whole frame,
+        # the values other than lists (e.g. missing tags) are kept as they are
+        records = items.to_dict("records")
+        for record, item_id in zip(records, items.index):
+            for col in tag_cols:
+                if isinstance(record[col], list):
+                    record[col] = ", ".join(record[col])
+            # the numbers kept missing are sent as nulls
+            for col in number_cols:
+                if record[col] is pd.NA:
+                    record[col] = None
+            record["id"] = item_id
+
+        return records
+
+    def serialize_embeddings(df: DataFrame):
+        # the embeddings are sent by columns, so no dict is created per each point
+        data = {"id": df.index.tolist()}
+        for col in df.columns:
+            data[col] = df[col].tolist()
 
-        return items_copy.to_dict("records")
+        return data
 
     def get_item_attributes() -> Dict[str, any]:
         attributes = {}
-        for col, datatype in dataset.item_cols().items():
+        for col, datatype in item_cols.items():
             attributes[col] = {"dtype": str(datatype)}
 
             if isinstance(datatype, dtypes.Tag):
@@ -63,32 +193,60 @@ def create_app(
 
         return attributes
 
+    item_attributes = get_item_attributes()
+
+    def to_json_body(data: Any) -> bytes:
+        # the same encoder as the one used by the json responses
+        return json(data).body
+
+    # these responses only depend on the loaded dataset and models,
+    # so they are serialized only once and sent as they are
+    web_config_body = to_json_body(dataset.web_default_config())
+    models_body = to_json_body({model.name(): model.to_dict() for model in models.values()})
+    # the web parameters are built from the dataset, so only their names are kept for the predictions
+    model_params = {name: frozenset(model.web_params().keys()) for name, model in models.items()}
+    dataset_body = to_json_body({"totalItems": dataset.get_total_items(), "attributes": item_attributes})
+    users_bodies = {split: to_json_body(dataset.get_users_by_split(split)) for split in dataset.splits}
+
+    @lru_cache(maxsize=128)
+    def get_sampled_users_body(split: str, sample_limit: int) -> bytes:
+        set_seed(config.seed)
+        return to_json_body(random.sample(dataset.get_users_by_split(split), sample_limit))
+
+    # the embeddings do not change while the server is running,
+    # so they are joined and serialized only on the first request
+    embeddings_cache: Dict[str, Dict[str, list]] = {}
+
     def validate_split_name(split: str):
         if not split:
             raise InvalidUsage("The dataset's split must be specified.")
 
-        if split not in ["train", "validation", "test"]:
+        if split not in SPLIT_NAMES:
             raise InvalidUsage("The split must be one of: train, validation or test.")
 
-    def get_items_by_query(query: Dict[str, any]) -> DataFrame:
+    def get_item_positions_by_query(query: Dict[str, any]) -> np.ndarray:
+        # positions of the matching rows in the items data frame
         col = query.get("attribute")
 
         if not col:
             raise InvalidUsage("Searched attribute must be specified.")
 
-        if col not in dataset.item_cols().keys():
+        if col not in item_cols:
             raise InvalidUsage(f"Attribute '{col}' not found.'")
 
-        col_type = type(dataset.item_cols().get(col))
+        col_type = item_col_types.get(col)
 
         items = dataset.items
+        mask = np.ones(items.shape[0], dtype=bool)
         if col_type == dtypes.Number:
             range_filter = query.get("range")
 
             if not range_filter or len(range_filter) != 2:
                 raise InvalidUsage(f"A range must be specified for '{col}' attribute.")
 
-            items = items[(items[col] >= range_filter[0]) & (items[col] <= range_filter[1])]
+            # the items with a missing number are out of any range
+            in_range = (items[col] >= range_filter[0]) & (items[col] <= range_filter[1])
+            mask = in_range.to_numpy(dtype=bool, na_value=False)
 
         if col_type == dtypes.Category or col_type == dtypes.Tag:
             values_filter = query.get("values")
@@ -97,74 +255,82 @@ def create_app(
                 raise InvalidUsage(f"Values must be specified for '{col}' attribute.")
 
             if col_type == dtypes.Category:
-                items = items[items[col] == values_filter[0]]
+                mask = (items[col] == values_filter[0]).to_numpy()
             else:
-                items = items[items[col].apply(lambda x: set(values_filter).issubset(set(x)))]
+                mask = dataset.get_tags_mask(col, values_filter)
+
+        return np.flatnonzero(mask)
 
-        return items
+    def get_users_by_query(query: Dict[str, any], split: str, min_interacts: int):
+        # the positions are translated to the indices directly, without looking up the ids
+        item_indices = dataset.item_positions_to_indices(get_item_positions_by_query(query))
+
+        return dataset.get_users_by_interacted_items(item_indices[item_indices >= 0], split, min_interacts)
 
     def get_items_description(items: DataFrame) -> Dict[str, Dict[str, Any]]:
         attributes = {}
 
-        tag_cols = filter_columns_by_type(dataset.item_cols(), dtypes.Tag)
         for col in tag_cols:
-            labels, counts = get_top_tags(items, col, n=4)
+            labels, counts = dataset.get_top_tags(items, col, n=4)
 
             if len(labels) > 0:
                 attributes[col] = {"labels": labels, "values": counts}
 
-        category_cols = filter_columns_by_type(dataset.item_cols(), dtypes.Category)
         for col in category_cols:
-            labels, counts = get_top_categories(items, col, n=4)
+            labels, counts = dataset.get_top_categories(items, col, n=4)
 
             if len(labels) > 0:
                 attributes[col] = {"labels": labels, "values": counts}
 
-        number_cols = filter_columns_by_type(dataset.item_cols(), dtypes.Number)
-        for col in number_cols:
-            values, bins = dataset.compute_histogram_by_col(items, col, bins=4)
+        histograms = dataset.compute_histograms(items, number_cols, bins=4)
+        for col, (values, bins) in histograms.items():
             attributes[col] = {"values": values.tolist(), "bins": bins.tolist()}
 
         return attributes
 
+    @lru_cache(maxsize=1)
+    def read_index_page() -> bytes:
+        with open(os.path.join(static_folder, "index.html"), "rb") as f:
+            return f.read()
+
     @app.route("/")
     @app.route("/dataset")
     @app.route("/models")
     @app.route("/widgets/<path_arg:path>")
     def index(request, **kwargs):
-        return file(f"{static_folder}/index.html")
+        # the page is read from the disk only once
+        return html(read_index_page(), headers={"Cache-Control": "public, max-age=60"})
+
+    @app.on_response
+    async def cache_static_assets(request, response):
+        # the names of the built assets contain a hash of their content
+        if request.path.startswith("/static/"):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
 
     @app.route("/api/web/config", methods=["GET"])
     async def get_web_config(request):
-        return json(dataset.web_default_config())
+        return raw(web_config_body, content_type="application/json")
 
     @app.route("/api/models", methods=["GET"])
     async def get_models(request):
-        return json({model.name(): model.to_dict() for model in models.values()})
+        return raw(models_body, content_type="application/json")
 
     @app.route("/api/dataset", methods=["GET"])
     async def get_dataset(request):
-        return json(
-            {
-                "totalItems": dataset.get_total_items(),
-                "attributes": get_item_attributes(),
-            }
-        )
+        return raw(dataset_body, content_type="application/json")
 
-    @app.route("/api/users", methods=["GET"])
+    # the handler does not call json(), so the format of the errors can not be guessed
+    @app.route("/api/users", methods=["GET"], error_format="json")
     async def get_users(request):
         split = request.args.get("split")
         sample_limit = request.args.get("sample")
 
         validate_split_name(split)
 
-        users = dataset.get_users_by_split(split)
-
         if sample_limit:
-            set_seed(config.seed)
-            users = random.sample(users, int(sample_limit))
+            return raw(get_sampled_users_body(split, int(sample_limit)), content_type="application/json")
 
-        return json(users)
+        return raw(users_bodies[split], content_type="application/json")
 
     @app.route("/api/items", methods=["GET"])
     async def get_items(request):
@@ -176,7 +342,7 @@ def create_app(
         if len(query) < 3:
             raise InvalidUsage("The query must have at least 3 characters.")
 
-        items = dataset.get_items_by_title(query)
+        items = await run_in_executor(app.ctx.executor, dataset.get_items_by_title, query)
         data = json(serialize_items(items))
 
         return data
@@ -195,26 +361,25 @@ def create_app(
             raise InvalidUsage("Either the user or his interactions must be specified.")
 
         if user_id is not None:
-            split = dataset.get_split_by_user(user_id)
+            # the id is resolved only once, the data are then selected by the index
+            location = dataset.locate_user(user_id)
 
-            if not split:
+            if not location:
                 raise InvalidUsage(f"User '{user_id}' not found.")
 
-            input_data = dataset.get_interactions_by_user(user_id, split)
+            input_data = dataset.get_interactions_by_index(*location)
         else:
-            item_indices = list(map(dataset.item_id_to_index, item_ids))
+            item_indices = dataset.item_ids_to_indices(item_ids)
 
-            if None in item_indices:
+            if np.any(item_indices < 0):
                 raise InvalidUsage(f"Some of the input items not found.")
 
             input_data = dataset.item_indices_to_matrix(item_indices)
 
-        model = models.get(model_name)
+        params = {k: v for k, v in params.items() if k in model_params[model_name]}
 
-        params = {k: v for k, v in params.items() if k in model.web_params().keys()}
-
-        ids = model.predict_top_items(input_data, limit, **params)
-        items = dataset.items.loc[np.squeeze(ids)]
+        ids = await predict_top_items(model_name, input_data, limit, params)
+        items = dataset.items.iloc[dataset.item_ids_to_positions(ids)]
         data = json(serialize_items(items))
 
         return data
@@ -226,9 +391,9 @@ def create_app(
         if not query:
             raise InvalidUsage("Search query must be specified.")
 
-        items = get_items_by_query(query)
+        positions = await run_in_executor(app.ctx.executor, get_item_positions_by_query, query)
 
-        return json(items.index.tolist())
+        return json(dataset.items.index[positions].tolist())
 
     @app.route("/api/users/search", methods=["POST"])
     async def search_users(request):
@@ -244,10 +409,7 @@ def create_app(
         if not min_interacts:
             raise InvalidUsage("Minimum interactions to the items by a user must be specified.")
 
-        items = get_items_by_query(query)
-        item_indices = items.index.map(dataset.item_id_to_index)
-
-        user_ids = dataset.get_users_by_interacted_items(item_indices, split, min_interacts)
+        user_ids = await run_in_executor(app.ctx.executor, get_users_by_query, query, split, min_interacts)
 
         return json(user_ids)
 
@@ -258,8 +420,13 @@ def create_app(
         if not item_ids or len(item_ids) == 0:
             raise InvalidUsage("A list of items must be specified.")
 
-        items = dataset.items.loc[item_ids]
-        description = get_items_description(items)
+        positions = dataset.item_ids_to_positions(item_ids)
+
+        if np.any(positions < 0):
+            raise InvalidUsage(f"Some of the input items not found.")
+
+        items = dataset.items.iloc[positions]
+        description = await run_in_executor(app.ctx.executor, get_items_description, items)
 
         return json({"description": description})
 
@@ -273,16 +440,13 @@ def create_app(
 
         validate_split_name(split)
 
-        def mapper_func(x):
-            return dataset.user_id_to_index(x, split)
-
-        user_indices = list(map(mapper_func, user_ids))
+        user_indices = dataset.user_ids_to_indices(user_ids, split)
 
-        if None in user_indices:
+        if np.any(user_indices < 0):
             raise InvalidUsage(f"Some of the input users not found.")
 
-        items = dataset.get_top_items_by_users(user_indices, split, n=100)
-        description = get_items_description(items)
+        items = await run_in_executor(app.ctx.executor, dataset.get_top_items_by_users, user_indices, split, n=100)
+        description = await run_in_executor(app.ctx.executor, get_items_description, items)
 
         return json(
             {
@@ -299,12 +463,13 @@ def create_app(
         if dataset_eval.item_embeddings is None:
             raise NotFound(f"No embeddings found.")
 
-        df = dataset_eval.item_embeddings.join(dataset.items[dataset.get_title_col()])
-        df = df.rename(columns={dataset.get_title_col(): "title"})
-        df = df.sort_index()
-        df["id"] = df.index
+        if "items" not in embeddings_cache:
+            df = dataset_eval.item_embeddings.join(dataset.items[dataset.get_title_col()])
+            df = df.rename(columns={dataset.get_title_col(): "title"})
+            df = df.sort_index()
+            embeddings_cache["items"] = serialize_embeddings(df)
 
-        return json(df.to_dict("records"))
+        return json(embeddings_cache["items"])
 
     @app.route("/api/users/embeddings", methods=["GET"])
     async def get_user_embeddings(request):
@@ -314,20 +479,20 @@ def create_app(
         if dataset_eval is None or dataset_eval.user_embeddings.get(split) is None:
             raise NotFound(f"No embeddings found for split '{split}'.")
 
-        df = dataset_eval.user_embeddings.get(split).copy()
-        df = df.sort_index()
-        df["id"] = df.index
+        if split not in embeddings_cache:
+            df = dataset_eval.user_embeddings.get(split).sort_index()
+            embeddings_cache[split] = serialize_embeddings(df)
 
-        return json(df.to_dict("records"))
+        return json(embeddings_cache[split])
 
     @app.route("/api/users/<uid>", methods=["GET"])
     async def get_user_detail(request, uid: str):
-        split = dataset.get_split_by_user(uid)
+        location = dataset.locate_user(uid)
 
-        if not split:
+        if not location:
             raise NotFound(f"User '{uid}' not found.")
 
-        items = dataset.get_interacted_items_by_user(uid, split)
+        items = dataset.get_interacted_items_by_index(*location)
         data = json({"interactions": serialize_items(items)})
 
         return data
@@ -393,4 +558,6 @@ def run_server(
 ) -> None:
     app = create_app(models, dataset, dataset_eval, model_eval, config)
     app.config.FALLBACK_ERROR_FORMAT = "json"
-    app.run(host="0.0.0.0", port=config.server_port, debug=False, access_log=False)
+    # the workers are forked after the dataset and the models are loaded, so they share
+    # their memory and serve the requests in parallel, each one by its own event loop
+    app.run(host="0.0.0.0", port=config.server_port, workers=config.server_workers, debug=False, access_log=False)
@@ -27,6 +27,7 @@ setuptools.setup(
         "coloredlogs==15.0.1",
         "numpy==1.24.4",
         "scipy==1.10.1",
+        "numba==0.58.1",
         "pandas==2.0.3",
         "bidict==0.22.1",
         "scikit-learn==1.3.0",
@@ -35,6 +36,7 @@ setuptools.setup(
     ],
     extras_require={
         "pymde": ["pymde==0.1.18", "pynndescent==0.5.10"],
+        "orjson": ["orjson==3.8.3"],
     },
     zip_safe=False,
 )
@@ -1,6 +1,11 @@
 import os
+
+import numpy as np
 import pandas as pd
 
+from repsys import dtypes
+from repsys.dataset import Dataset
+
 
 def get_fixtures_path():
     abs_path = os.path.abspath(os.path.dirname(__file__))
@@ -15,3 +20,65 @@ def load_items(file_name):
 def load_interacts(file_name):
     path = os.path.join(get_fixtures_path(), "interacts", file_name)
     return pd.read_csv(path, header=0)
+
+
+def generate_items(n_items):
+    return pd.DataFrame(
+        {
+            "movieId": np.arange(n_items) * 3 + 1,
+            "title": [f"Movie {i} ({1950 + i % 50})" for i in range(n_items)],
+            "genres": ["|".join(["Action", "Comedy", "Drama"][: i % 3 + 1]) for i in range(n_items)],
+        }
+    )
+
+
+def generate_interacts(n_users, n_items, max_interacts=20, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for user in range(n_users):
+        n = rng.integers(5, max_interacts + 1)
+        for item in rng.choice(n_items, size=n, replace=False):
+            rows.append((user * 7 + 1, item * 3 + 1, 1))
+
+    return pd.DataFrame(rows, columns=["userId", "movieId", "rating"])
+
+
+class SyntheticDataset(Dataset):
+    def __init__(self, n_users=300, n_items=100, seed=0):
+        self.n_users = n_users
+        self.n_items = n_items
+        self.seed = seed
+
+    def name(self):
+        return "synthetic"
+
+    def item_cols(self):
+        return {
+            "movieId": dtypes.ItemID(),
+            "title": dtypes.Title(),
+            "genres": dtypes.Tag(sep="|"),
+        }
+
+    def interaction_cols(self):
+        return {
+            "movieId": dtypes.ItemID(),
+            "userId": dtypes.UserID(),
+            "rating": dtypes.Interaction(),
+        }
+
+    def load_items(self):
+        return generate_items(self.n_items)
+
+    def load_interactions(self):
+        return generate_interacts(self.n_users, self.n_items, seed=self.seed)
+
+
+class YearDataset(SyntheticDataset):
+    def item_cols(self):
+        return {**super().item_cols(), "year": dtypes.Number(data_type=int, empty_value=None)}
+
+    def load_items(self):
+        items = super().load_items()
+        # every fourth movie has no year
+        items["year"] = [None if i % 4 == 0 else 1950 + i for i in range(self.n_items)]
+        return items
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+from repsys import dtypes
+
+from .helpers import SyntheticDataset, YearDataset
+
+
+class CategoryDataset(SyntheticDataset):
+    def item_cols(self):
+        return {**super().item_cols(), "kind": dtypes.Category()}
+
+    def load_items(self):
+        items = super().load_items()
+        items["kind"] = [["movie", "series", "short"][i % (3 if self.n_items > 80 else 2)] for i in range(self.n_items)]
+        return items
+
+
+def test_datasets_do_not_share_tags():
+    first = SyntheticDataset(n_users=100, n_items=100)
+    first.fit(0.8, 0.2, 5, 0, 1234)
+    second = SyntheticDataset(n_users=100, n_items=60)
+    second.fit(0.8, 0.2, 5, 0, 1234)
+
+    for dataset, n_items in [(first, 100), (second, 60)]:
+        mask = dataset.get_tags_mask("genres", ["Comedy"])
+        assert mask.shape == (n_items,)
+        np.testing.assert_array_equal(mask, dataset.items["genres"].map(lambda tags: "Comedy" in tags).to_numpy())
+
+        tags, counts = dataset.get_top_tags(dataset.items, "genres")
+        assert tags[0] == "Action"
+        assert counts[0] == n_items
+
+
+def test_datasets_do_not_share_categories():
+    first = CategoryDataset(n_users=100, n_items=100)
+    first.fit(0.8, 0.2, 5, 0, 1234)
+    second = CategoryDataset(n_users=100, n_items=60)
+    second.fit(0.8, 0.2, 5, 0, 1234)
+
+    for dataset in [first, second]:
+        categories, counts = dataset.get_top_categories(dataset.items, "kind")
+        expected = dataset.items["kind"].value_counts()
+
+        assert sorted(categories) == sorted(expected.index)
+        assert dict(zip(categories, counts)) == expected.to_dict()
+
+
+def test_missing_numbers_are_kept_missing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dataset = YearDataset()
+    dataset.fit(0.8, 0.2, 5, 0, 1234)
+
+    years = dataset.items["year"]
+    assert years.dtype == "Int64"
+    assert years.isna().any()
+    assert not (years == 0).any()
+
+    # the missing years are neither counted in the histogram nor found by any range
+    values, bins = dataset.histograms["year"]
+    assert values.sum() <= years.notna().sum()
+    assert bins[0] > 0
+    indices = dataset.filter_items_by_number("year", (0, 3000))
+    assert indices.shape[0] == years.notna().sum()
+
+    dataset.save(str(tmp_path))
+    loaded = YearDataset()
+    loaded.load(str(tmp_path))
+
+    pd.testing.assert_series_equal(loaded.items["year"], years)
@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+import pytest
+from bidict import frozenbidict
+from scipy.sparse import csr_matrix
+
+from repsys.dataset import DatasetSplitter, Split, df_to_matrix, load_split, save_split
+
+
+def generate_interactions(n_users=200, n_items=50, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for user in range(n_users):
+        # the users have from one to twenty interactions
+        for item in rng.choice(n_items, size=user % min(n_items, 20) + 1, replace=False):
+            rows.append((user, item, 1.0))
+
+    return pd.DataFrame(rows, columns=["user", "item", "value"])
+
+
+def to_pairs(df):
+    return set(zip(df["user"], df["item"]))
+
+
+@pytest.mark.parametrize("holdout_prop", [0.1, 0.2, 0.5])
+def test_holdout_fraction_per_user(holdout_prop):
+    df = generate_interactions()
+    splitter = DatasetSplitter(0.8, holdout_prop, 0, 0, 1234)
+
+    train_data, holdout_data = splitter._split_holdout(df)
+
+    # the interactions are only divided, none of them is lost or duplicated
+    assert to_pairs(train_data) | to_pairs(holdout_data) == to_pairs(df)
+    assert not to_pairs(train_data) & to_pairs(holdout_data)
+    assert train_data.shape[0] + holdout_data.shape[0] == df.shape[0]
+
+    counts = df.groupby("user").size()
+    holdout_counts = holdout_data.groupby("user").size().reindex(counts.index, fill_value=0)
+
+    # every user holds out at least one interaction
+    assert (holdout_counts >= 1).all()
+    assert (holdout_counts == np.ceil(holdout_prop * counts).astype(int)).all()
+
+
+def test_split_keeps_min_user_interactions():
+    df = generate_interactions()
+    splitter = DatasetSplitter(0.8, 0.2, 5, 0, 1234)
+
+    (train_users, train_data), vad, test = splitter.split(df)
+
+    assert (train_data.groupby("user").size() >= 5).all()
+
+    for users, train_data, holdout_data in [vad, test]:
+        counts = pd.concat([train_data, holdout_data]).groupby("user").size()
+        assert set(counts.index) == set(users)
+        assert (counts >= 5).all()
+
+
+def test_split_is_deterministic_for_fixed_seed():
+    df = generate_interactions()
+
+    first = DatasetSplitter(0.8, 0.2, 5, 0, 1234).split(df)
+    second = DatasetSplitter(0.8, 0.2, 5, 0, 1234).split(df)
+
+    for first_parts, second_parts in zip(first, second):
+        assert list(first_parts[0]) == list(second_parts[0])
+        for first_df, second_df in zip(first_parts[1:], second_parts[1:]):
+            pd.testing.assert_frame_equal(first_df, second_df)
+
+    other = DatasetSplitter(0.8, 0.2, 5, 0, 4321).split(df)
+    assert list(first[0][0]) != list(other[0][0])
+
+
+def test_df_to_matrix_matches_coo_construction():
+    rng = np.random.default_rng(0)
+    n_users, n_items = 30, 20
+    # unsorted interactions with repeated user-item pairs and users without interactions
+    df = pd.DataFrame(
+        {
+            "user": rng.integers(0, n_users - 5, size=300),
+            "item": rng.integers(0, n_items, size=300),
+            "value": rng.random(300).astype(np.float32),
+        }
+    )
+
+    matrix = df_to_matrix(df, n_users, n_items)
+    expected = csr_matrix((df["value"], (df["user"], df["item"])), shape=(n_users, n_items))
+
+    assert matrix.shape == (n_users, n_items)
+    assert matrix.has_canonical_format
+    assert matrix.nnz == expected.nnz
+    np.testing.assert_array_equal(matrix.indptr, expected.indptr)
+    np.testing.assert_array_equal(matrix.indices, expected.indices)
+    np.testing.assert_allclose(matrix.data, expected.data, rtol=1e-6)
+
+
+def test_df_to_matrix_empty():
+    df = pd.DataFrame({"user": np.array([], dtype=np.int32), "item": np.array([], dtype=np.int32), "value": []})
+
+    matrix = df_to_matrix(df, 3, 4)
+
+    assert matrix.shape == (3, 4)
+    assert matrix.nnz == 0
+
+
+def create_split():
+    df = generate_interactions(n_users=20, n_items=10)
+    train_data, holdout_data = DatasetSplitter(0.8, 0.2, 0, 0, 1234)._split_holdout(df)
+    user_index = frozenbidict({str(user * 7): user for user in range(20)})
+
+    return Split(df_to_matrix(train_data, 20, 10), user_index, df_to_matrix(holdout_data, 20, 10))
+
+
+def assert_matrix_equal(matrix, expected):
+    assert matrix.shape == expected.shape
+    assert matrix.dtype == expected.dtype
+    np.testing.assert_array_equal(matrix.toarray(), expected.toarray())
+
+
+def test_split_npz_round_trip(tmp_path):
+    split = create_split()
+
+    save_split("validation", split, str(tmp_path))
+    user_index, train_matrix, holdout_matrix = load_split("validation", str(tmp_path), 10)
+
+    assert (tmp_path / "validation_train.npz").is_file()
+    assert user_index == split.user_index
+    assert_matrix_equal(train_matrix, split.train_matrix)
+    assert_matrix_equal(holdout_matrix, split.holdout_matrix)
+
+
+def test_split_without_holdout_round_trip(tmp_path):
+    split = create_split()
+    split = Split(split.train_matrix, split.user_index)
+
+    save_split("train", split, str(tmp_path))
+    user_index, train_matrix, holdout_matrix = load_split("train", str(tmp_path), 10)
+
+    assert user_index == split.user_index
+    assert_matrix_equal(train_matrix, split.train_matrix)
+    assert holdout_matrix is None
+
+
+def test_load_legacy_csv_split(tmp_path):
+    split = create_split()
+
+    # the older versions stored the splits as CSV interactions
+    for name, matrix in [("train", split.train_matrix), ("holdout", split.holdout_matrix)]:
+        coo = matrix.tocoo()
+        df = pd.DataFrame({"user": coo.row, "item": coo.col, "value": coo.data.astype(int)})
+        df.to_csv(tmp_path / f"test_{name}.csv", index=False)
+
+    with open(tmp_path / "test_users.txt", "w") as f:
+        f.writelines(f"{uid}\n" for uid in split.user_index.keys())
+
+    user_index, train_matrix, holdout_matrix = load_split("test", str(tmp_path), 10)
+
+    assert user_index == split.user_index
+    assert_matrix_equal(train_matrix, split.train_matrix)
+    assert_matrix_equal(holdout_matrix, split.holdout_matrix)
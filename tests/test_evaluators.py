@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.sparse import csr_matrix
+
+from repsys.config import read_config
+from repsys.evaluators import ModelEvaluator
+from repsys.model import Model
+
+from .helpers import SyntheticDataset
+
+
+class CooccurModel(Model):
+    batchable = True
+
+    def name(self):
+        return "cooccur"
+
+    def fit(self, training: bool = False):
+        X = self.dataset.get_train_data()
+        self.similarity = (X.T @ X).toarray()
+        np.fill_diagonal(self.similarity, 0)
+
+    def predict(self, X: csr_matrix, **kwargs):
+        return X @ self.similarity
+
+
+class RandomModel(Model):
+    # the same random scores are drawn for each call, so the
+    # predictions of a user depend on its position in the input
+    def name(self):
+        return "random"
+
+    def fit(self, training: bool = False):
+        pass
+
+    def predict(self, X: csr_matrix, **kwargs):
+        return np.random.default_rng(0).random(X.shape)
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    dataset = SyntheticDataset()
+    dataset.fit(0.8, 0.2, 5, 0, 1234)
+    return dataset
+
+
+def evaluate(dataset, model, batch_size):
+    model.update(dataset, read_config())
+    model.fit()
+
+    evaluator = ModelEvaluator(dataset, ndcg_k=[50], batch_size=batch_size)
+    evaluator.evaluate(model, "validation")
+
+    return evaluator.get_current_summary(model.name()), evaluator.get_user_results(model.name())
+
+
+@pytest.mark.parametrize("model_class", [CooccurModel, RandomModel])
+def test_batched_metrics_equal_unbatched_metrics(dataset, model_class):
+    n_users = dataset.splits["validation"].train_matrix.shape[0]
+
+    batched_summary, batched_users = evaluate(dataset, model_class(), 7)
+    summary, users = evaluate(dataset, model_class(), n_users)
+
+    pd.testing.assert_frame_equal(batched_summary, summary)
+    pd.testing.assert_frame_equal(batched_users, users)
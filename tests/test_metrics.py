@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+from repsys.metrics import (
+    count_hits,
+    get_error_metrics,
+    get_idcg,
+    get_ndcg,
+    get_precision_recall,
+    sum_dcg,
+    sum_idcg,
+)
+
+# the third user has an empty holdout and the second one has graded values
+X_TRUE = np.array(
+    [
+        [1, 0, 1, 0, 0, 1],
+        [0, 2, 0, 0, 3, 0],
+        [0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 1, 0, 0],
+    ],
+    dtype=np.float32,
+)
+
+# the predictions are ranked up to the maximal k of the evaluation
+SORT_INDICES = np.array(
+    [
+        [0, 1, 2, 3, 4],
+        [4, 3, 1, 0, 5],
+        [0, 1, 2, 3, 4],
+        [5, 4, 3, 2, 1],
+    ]
+)
+
+
+def dense_hits(X_true, sort_indices, k):
+    rows = np.arange(X_true.shape[0])[:, np.newaxis]
+    return (X_true[rows, sort_indices[:, :k]] > 0).sum(axis=1)
+
+
+def dense_dcg(X_true, sort_indices, k):
+    rows = np.arange(X_true.shape[0])[:, np.newaxis]
+    discount = 1.0 / np.log2(np.arange(2, k + 2))
+    return (X_true[rows, sort_indices[:, :k]] * discount).sum(axis=1)
+
+
+def dense_idcg(X_true, k):
+    discount = 1.0 / np.log2(np.arange(2, k + 2))
+    return (-np.sort(-X_true, axis=1)[:, :k] * discount).sum(axis=1)
+
+
+@pytest.mark.parametrize("k", [1, 3, 5])
+def test_count_hits(k):
+    X_true = csr_matrix(X_TRUE)
+    hits = np.zeros(X_true.shape[0], dtype=np.float32)
+
+    count_hits(X_true.indptr, X_true.indices, X_true.data, SORT_INDICES, k, hits)
+
+    np.testing.assert_array_equal(hits, dense_hits(X_TRUE, SORT_INDICES, k))
+
+
+def test_count_hits_skips_stored_zeros():
+    X_true = csr_matrix(X_TRUE)
+    X_true.data[0] = 0
+    hits = np.zeros(X_true.shape[0], dtype=np.float32)
+
+    count_hits(X_true.indptr, X_true.indices, X_true.data, SORT_INDICES, 3, hits)
+
+    np.testing.assert_array_equal(hits, [1, 2, 0, 1])
+
+
+@pytest.mark.parametrize("k", [1, 3, 5])
+def test_sum_dcg(k):
+    X_true = csr_matrix(X_TRUE)
+    discount = 1.0 / np.log2(np.arange(2, k + 2))
+    dcg = np.zeros(X_true.shape[0])
+
+    sum_dcg(X_true.indptr, X_true.indices, X_true.data, np.ascontiguousarray(SORT_INDICES[:, :k]), discount, dcg)
+
+    np.testing.assert_allclose(dcg, dense_dcg(X_TRUE, SORT_INDICES, k))
+
+
+@pytest.mark.parametrize("k", [1, 2, 5])
+def test_sum_idcg(k):
+    X_true = csr_matrix(X_TRUE)
+    discount = 1.0 / np.log2(np.arange(2, k + 2))
+    idcg = np.zeros(X_true.shape[0])
+
+    sum_idcg(X_true.indptr, X_true.data, discount, idcg)
+
+    np.testing.assert_allclose(idcg, dense_idcg(X_TRUE, k))
+
+
+def test_precision_recall_with_smaller_k():
+    X_true = csr_matrix(X_TRUE)
+    X_true_nonzero = np.diff(X_true.indptr)
+
+    with np.errstate(invalid="ignore"):
+        precision, recall = get_precision_recall(X_true, X_true_nonzero, SORT_INDICES, 3)
+
+    np.testing.assert_allclose(precision, [2 / 3, 2 / 3, 0, 1 / 3])
+    # the recall of the user with an empty holdout is undefined
+    np.testing.assert_allclose(recall, [2 / 3, 1, np.nan, 1])
+
+
+@pytest.mark.parametrize("k", [1, 3, 5])
+def test_ndcg(k):
+    X_true = csr_matrix(X_TRUE)
+
+    with np.errstate(invalid="ignore"):
+        ndcg = get_ndcg(X_true, get_idcg(X_true, k), SORT_INDICES, k)
+        expected = dense_dcg(X_TRUE, SORT_INDICES, k) / dense_idcg(X_TRUE, k)
+
+    np.testing.assert_allclose(ndcg, expected)
+    assert np.isnan(ndcg[2])
+    assert np.all(ndcg[~np.isnan(ndcg)] <= 1)
+
+
+def test_error_metrics():
+    rng = np.random.default_rng(0)
+    X_predict = rng.random(X_TRUE.shape).astype(np.float32)
+
+    mae, mse, rmse = get_error_metrics(X_predict, csr_matrix(X_TRUE))
+
+    diff = X_TRUE - X_predict
+    np.testing.assert_allclose(mae, np.abs(diff).mean(axis=1), rtol=1e-6)
+    np.testing.assert_allclose(mse, np.square(diff).mean(axis=1), rtol=1e-6)
+    np.testing.assert_allclose(rmse, np.sqrt(np.square(diff).mean(axis=1)), rtol=1e-6)
@@ -0,0 +1,137 @@
+import asyncio
+
+import numpy as np
+import pytest
+from sanic_testing.testing import SanicASGITestClient
+from scipy.sparse import csr_matrix
+
+from repsys.config import read_config
+from repsys.evaluators import DatasetEvaluator, ModelEvaluator
+from repsys.model import Model
+from repsys.server import create_app
+
+from .helpers import SyntheticDataset, YearDataset
+
+
+class CooccurModel(Model):
+    batchable = True
+
+    def __init__(self):
+        self.calls = []
+        self.similarity = None
+
+    def name(self):
+        return "cooccur"
+
+    def fit(self, training: bool = False):
+        X = self.dataset.get_train_data()
+        self.similarity = (X.T @ X).toarray()
+        np.fill_diagonal(self.similarity, 0)
+
+    def predict(self, X: csr_matrix, **kwargs):
+        self.calls.append(X.shape[0])
+        if np.any(np.diff(X.indptr) == 1):
+            raise ValueError("At least two interactions are required.")
+
+        return X @ self.similarity
+
+
+class UnbatchableModel(CooccurModel):
+    batchable = False
+
+    def name(self):
+        return "unbatchable"
+
+
+@pytest.fixture(scope="module")
+def app():
+    dataset = SyntheticDataset()
+    dataset.fit(0.8, 0.2, 5, 0, 1234)
+    config = read_config()
+
+    models = {}
+    for model in [CooccurModel(), UnbatchableModel()]:
+        model.update(dataset, config)
+        model.fit()
+        models[model.name()] = model
+
+    app = create_app(models, dataset, DatasetEvaluator(dataset), ModelEvaluator(dataset), config)
+    app.ctx.models = models
+    app.ctx.users = dataset.get_users_by_split("validation")[:10]
+    return app
+
+
+def predict_concurrently(app, model_name, bodies):
+    client = SanicASGITestClient(app)
+
+    async def predict_all():
+        requests = [client.post(f"/api/models/{model_name}/predict", json=body) for body in bodies]
+        return await asyncio.gather(*requests)
+
+    return [response for _, response in asyncio.run(predict_all())]
+
+
+def predict_one_by_one(app, model_name, bodies):
+    return [app.test_client.post(f"/api/models/{model_name}/predict", json=body)[1] for body in bodies]
+
+
+def test_batched_predictions_equal_single_predictions(app):
+    model = app.ctx.models["cooccur"]
+    bodies = [{"user": user, "limit": 5} for user in app.ctx.users]
+
+    model.calls.clear()
+    single = predict_one_by_one(app, "cooccur", bodies)
+    assert model.calls == [1] * len(bodies)
+
+    model.calls.clear()
+    batched = predict_concurrently(app, "cooccur", bodies)
+    assert max(model.calls) > 1
+
+    assert [r.status for r in batched] == [200] * len(bodies)
+    assert [r.json for r in batched] == [r.json for r in single]
+
+
+def test_batch_separates_different_limits(app):
+    bodies = [{"user": app.ctx.users[0], "limit": 5}, {"user": app.ctx.users[0], "limit": 3}]
+
+    single = predict_one_by_one(app, "cooccur", bodies)
+    batched = predict_concurrently(app, "cooccur", bodies)
+
+    assert [len(r.json) for r in batched] == [5, 3]
+    assert [r.json for r in batched] == [r.json for r in single]
+
+
+def test_failing_request_does_not_fail_batch(app):
+    bodies = [{"user": user, "limit": 5} for user in app.ctx.users[:3]]
+    single = predict_one_by_one(app, "cooccur", bodies)
+
+    item_id = single[0].json[0]["id"]
+    batched = predict_concurrently(app, "cooccur", bodies + [{"items": [item_id], "limit": 5}])
+
+    assert [r.status for r in batched] == [200, 200, 200, 500]
+    assert [r.json for r in batched[:3]] == [r.json for r in single]
+
+
+def test_unbatchable_model_predicts_users_one_by_one(app):
+    model = app.ctx.models["unbatchable"]
+    bodies = [{"user": user, "limit": 5} for user in app.ctx.users]
+
+    model.calls.clear()
+    predict_concurrently(app, "unbatchable", bodies)
+
+    assert model.calls == [1] * len(bodies)
+
+
+def test_missing_numbers_are_sent_as_nulls():
+    dataset = YearDataset()
+    dataset.fit(0.8, 0.2, 5, 0, 1234)
+    app = create_app({}, dataset, DatasetEvaluator(dataset), ModelEvaluator(dataset), read_config())
+
+    _, response = app.test_client.get("/api/items", params={"query": "Movie"})
+    years = [item["year"] for item in response.json]
+    assert None in years
+    assert 0 not in years
+
+    query = {"attribute": "year", "range": [0, 3000]}
+    _, response = app.test_client.post("/api/items/search", json={"query": query})
+    assert len(response.json) == dataset.items["year"].notna().sum()